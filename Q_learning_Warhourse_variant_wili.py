@@ -2,169 +2,77 @@
 # Optimizing warehouse flows with Q-learning
 
 # Importing the libraries
-import numpy as np
-import csv
-from datetime import datetime
-
-# Parameters gamma and alpha
-gamma = 0.75
-alpha = 0.9
-
-# States
-location_to_state = {
-    'A': 0,
-    'B': 1,
-    'C': 2,
-    'D': 3,
-    'E': 4,
-    'F': 5,
-    'G': 6,
-    'H': 7,
-    'I': 8,
-    'J': 9,
-    'K': 10,
-    'L': 11
-}
-state_to_location = {state: location for location, state in location_to_state.items()}
+import sys
+import qlearning
+import route_batch
+import route_log
+from fleet import FleetPlanner, Robot
+
+# Warehouse layout and states: shared with the engine (qlearning.py)
+from qlearning import location_to_state
+layout = qlearning.default_graph
 
 # Actions
-actions = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11]
-
-def save_route_to_csv(start_point, end_point, route, filename="optimal_routes.csv"):
-    """Save the route information to a CSV file"""
-    try:
-        # Try to open the file in append mode first to check if it exists
-        with open(filename, 'a', newline='') as file:
-            pass
-    except FileNotFoundError:
-        # If file doesn't exist, create it with headers
-        with open(filename, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(["Timestamp", "Start Point", "End Point", "Optimal Route", "Number of Steps"])
-
-    # Append the new route information
-    with open(filename, 'a', newline='') as file:
-        writer = csv.writer(file)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        route_str = " -> ".join(route)
-        writer.writerow([timestamp, start_point, end_point, route_str, len(route)])
+actions = list(range(layout.n_states))
+
+def save_route(start_point, end_point, route, filename="optimal_routes.db"):
+    """Queue the route information for the route history (written in batches by route_log)"""
+    route_log.get_writer(filename).log(start_point, end_point, route)
 
 def route(starting_location, ending_location):
-    # Rewards
-    R = np.array([[0,1,0,0,0,0,0,0,0,0,0,0],
-                  [1,0,1,0,0,1,0,0,0,0,0,0],
-                  [0,1,0,0,0,0,1,0,0,0,0,0],
-                  [0,0,0,0,0,0,0,1,0,0,0,0],
-                  [0,0,0,0,0,0,0,0,1,0,0,0],
-                  [0,1,0,0,0,0,0,0,0,1,0,0],
-                  [0,0,1,0,0,0,0,1,0,0,0,0],
-                  [0,0,0,1,0,0,1,0,0,0,0,1],
-                  [0,0,0,0,1,0,0,0,0,1,0,0],
-                  [0,0,0,0,0,1,0,0,1,0,1,0],
-                  [0,0,0,0,0,0,0,0,0,1,0,1],
-                  [0,0,0,0,0,0,0,1,0,0,1,0]])
-
-    ending_state = location_to_state[ending_location]
-    R[ending_state, ending_state] = 1000
-
-    # Initialisation des Q-values (training matrix Q)
-    Q = np.zeros([12, 12])
-    for _ in range(1000):
-        # Nous exécutons une action aléatoire a_t
-        current_state = np.random.randint(0, 12)
-        # Liste des actions possibles
-        playable_actions = []
-        for j in range(12):
-            if R[current_state, j] > 0:
-                playable_actions.append(j)
-        next_state = np.random.choice(playable_actions)
-        TD = R[current_state, next_state] + gamma * Q[next_state, np.argmax(Q[next_state,])] - Q[current_state, next_state]
-        Q[current_state, next_state] = Q[current_state, next_state] + alpha * TD
-
-    # Find optimal route
-    route_path = [starting_location]
-    next_location = starting_location
-    while next_location != ending_location:
-        starting_state = location_to_state[next_location]
-        next_state = np.argmax(Q[starting_state,])
-        next_location = state_to_location[next_state]
-        route_path.append(next_location)
+    # Policy trained (once, then cached) by the shared engine
+    route_path = qlearning.route(starting_location, ending_location)
 
     # Save the route to CSV
-    save_route_to_csv(starting_location, ending_location, route_path)
+    save_route(starting_location, ending_location, route_path)
 
     return route_path
 
 
-def route_priority(starting_location, ending_location, M=1000):
-    # Rewards
-    R = np.array([[0,1,0,0,0,0,0,0,0,0,0,0],
-                  [1,0,1,0,0,1,0,0,0,0,0,0],
-                  [0,1,0,0,0,0,1,0,0,0,0,0],
-                  [0,0,0,0,0,0,0,1,0,0,0,0],
-                  [0,0,0,0,0,0,0,0,1,0,0,0],
-                  [0,1,0,0,0,0,0,0,0,1,0,0],
-                  [0,0,1,0,0,0,0,1,0,0,0,0],
-                  [0,0,0,1,0,0,1,0,0,0,0,1],
-                  [0,0,0,0,1,0,0,0,0,1,0,0],
-                  [0,0,0,0,0,1,0,0,1,0,1,0],
-                  [0,0,0,0,0,0,0,0,0,1,0,1],
-                  [0,0,0,0,0,0,0,1,0,0,1,0]])
-
-    ending_state = location_to_state[ending_location]
-    R[ending_state, ending_state] = M
-    
-    for i, node_init in enumerate(nodes_init):
-        R[node_init, node_init] = M-10*i
-
-    # Initialisation des Q-values (training matrix Q)
-    Q = np.zeros([12, 12])
-    for _ in range(1000):
-        # Nous exécutons une action aléatoire a_t
-        current_state = np.random.randint(0, 12)
-        # Liste des actions possibles
-        playable_actions = []
-        for j in range(12):
-            if R[current_state, j] > 0:
-                playable_actions.append(j)
-        next_state = np.random.choice(playable_actions)
-        TD = R[current_state, next_state] + gamma * Q[next_state, np.argmax(Q[next_state,])] - Q[current_state, next_state]
-        Q[current_state, next_state] = Q[current_state, next_state] + alpha * TD
-
-    # Find optimal route
+def route_priority(starting_location, ending_location, priority_locations=()):
+    # Visit the priority locations first (most urgent first), then the destination,
+    # each leg following the engine's cached policy of its target
+    waypoints = [starting_location, *priority_locations, ending_location]
     route_path = [starting_location]
-    next_location = starting_location
-    while next_location != ending_location:
-        starting_state = location_to_state[next_location]
-        next_state = np.argmax(Q[starting_state,])
-        next_location = state_to_location[next_state]
-        route_path.append(next_location)
+    for leg_start, leg_end in zip(waypoints, waypoints[1:]):
+        route_path += qlearning.route(leg_start, leg_end)[1:]
 
     # Save the route to CSV
-    save_route_to_csv(starting_location, ending_location, route_path)
+    save_route(starting_location, ending_location, route_path)
 
     return route_path
 
+def plan_fleet(missions):
+    # Missions (start, end), listed from the highest to the lowest priority
+    planner = FleetPlanner(layout)
+    robots = [Robot(f"R{i + 1}", start, end, len(missions) - i) for i, (start, end) in enumerate(missions)]
+    return planner.plan(robots)
+
 def best_route(starting_location, ending_location, intermediary_location):
     route1 = route(starting_location, intermediary_location)
     route2 = route(intermediary_location, ending_location)[1:]
     full_route = route1 + route2
 
     # Save the combined route to CSV
-    save_route_to_csv(starting_location, ending_location, full_route)
+    save_route(starting_location, ending_location, full_route)
 
     return full_route
 
+# Mode non interactif : python Q_learning_Warhourse_variant_wili.py requests.jsonl -o routes.csv (voir route_batch.py)
+if len(sys.argv) > 1:
+    sys.exit(route_batch.main())
+
 # Interface utilisateur simple
 print("Système d'optimisation de routes d'entrepôt")
 print("----------------------------------------")
 print("Options disponibles:")
 print("1. Trouver la route optimale entre deux points")
 print("2. Trouver la meilleure route via un point intermédiaire")
-print("3. Quitter")
+print("3. Planifier une flotte de robots")
+print("4. Quitter")
 
 while True:
-    choice = input("\nChoisissez une option (1-3): ")
+    choice = input("\nChoisissez une option (1-4): ")
 
     if choice == "1":
         start = input("Point de départ (A-L): ").upper()
@@ -172,7 +80,7 @@ while True:
         if start in location_to_state and end in location_to_state:
             optimal_route = route(start, end)
             print(f"\nRoute optimale: {' -> '.join(optimal_route)}")
-            print(f"Le résultat a été enregistré dans optimal_routes.csv")
+            print(f"Le résultat a été enregistré dans optimal_routes.db")
         else:
             print("Points invalides. Veuillez utiliser des lettres entre A et L.")
 
@@ -184,13 +92,23 @@ while True:
             and end in location_to_state):
             optimal_route = best_route(start, end, intermediary)
             print(f"\nMeilleure route: {' -> '.join(optimal_route)}")
-            print(f"Le résultat a été enregistré dans optimal_routes.csv")
+            print(f"Le résultat a été enregistré dans optimal_routes.db")
         else:
             print("Points invalides. Veuillez utiliser des lettres entre A et L.")
 
     elif choice == "3":
+        entries = input("Missions départ-arrivée par priorité décroissante (ex: A-L,L-A,D-E): ").upper()
+        missions = [tuple(part.strip() for part in entry.split("-")) for entry in entries.split(",") if entry.strip()]
+        if missions and all(len(mission) == 2 and all(point in location_to_state for point in mission)
+                            for mission in missions):
+            for name, path in plan_fleet(missions).items():
+                print(f"{name}: {' -> '.join(path) if path else 'aucun chemin libre, reste sur place'}")
+        else:
+            print("Missions invalides. Utilisez le format A-L,L-A avec des lettres entre A et L.")
+
+    elif choice == "4":
         print("Merci d'avoir utilisé notre système. Au revoir!")
         break
 
     else:
-        print("Option invalide. Veuillez choisir 1, 2 ou 3.")
\ No newline at end of file
+        print("Option invalide. Veuillez choisir 1, 2, 3 ou 4.")
\ No newline at end of file
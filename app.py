@@ -1,10 +1,61 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file
-from qlearning import route, best_route
+from flask import Flask, render_template, request, redirect, url_for, jsonify, Response, stream_with_context, g
+from qlearning import route, best_route, warm_cache, location_to_state, route_many, solvers, train_in_place
+import time
+from pick_list import multi_stop_route
 import os
-from datetime import datetime
+import cProfile
+import random
+import route_log
+import metrics
 
 app = Flask(__name__)
 
+# Historique des routes (SQLite, voir route_history.py)
+ROUTES_DB = os.environ.get('ROUTES_DB', 'routes_log.db')
+if not ROUTES_DB.endswith(('.db', '.sqlite')):
+    # /download interroge l'historique : un journal CSV doit d'abord être importé
+    raise RuntimeError(f"ROUTES_DB doit être une base SQLite (.db ou .sqlite), pas {ROUTES_DB!r} : "
+                       f"importer le CSV avec python route_history.py routes_log.db import {ROUTES_DB}")
+
+# Profilage optionnel : avec PROFILE_SLOW_MS=500, une fraction PROFILE_SAMPLE_RATE des requêtes
+# est profilée avec cProfile et le profil de celles qui dépassent 500 ms est enregistré dans PROFILE_DIR
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 1.0))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
+
+# Pré-entraîner les politiques des 12 destinations au démarrage
+if os.environ.get('PREWARM_POLICIES') == '1':
+    warm_cache()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.profiler = None
+    if PROFILE_SLOW_MS and random.random() < PROFILE_SAMPLE_RATE:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+        # Le profileur ne suit que ce thread : l'entraînement doit s'y faire pour apparaître dans le profil
+        train_in_place()
+
+@app.after_request
+def record_request_time(response):
+    elapsed = time.perf_counter() - g.request_started
+    metrics.observe('request_seconds', elapsed, endpoint=request.endpoint or 'unknown')
+    return response
+
+# teardown_request s'exécute aussi quand la vue lève une exception, contrairement à after_request
+@app.teardown_request
+def stop_profiler(error=None):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        train_in_place(False)
+        elapsed = time.perf_counter() - g.request_started
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            profiler.dump_stats(os.path.join(
+                PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{request.endpoint}-{int(elapsed * 1000)}ms.prof"))
+
 @app.route('/')
 def home():
     return render_template('index.html')
@@ -15,41 +66,121 @@ def optimize():
         start = request.form['start'].strip().upper()
         end = request.form['end'].strip().upper()
         intermediary = request.form.get('intermediary', '').strip().upper()
+        stops = [stop.strip().upper() for stop in request.form.get('stops', '').split(',') if stop.strip()]
 
         # Validation des entrées
-        if not (start in location_to_state and end in location_to_state):
-            raise ValueError("Points de départ/arrivée invalides")
-        
-        if intermediary and intermediary not in location_to_state:
-            raise ValueError("Point intermédiaire invalide")
-
-        if intermediary:
-            path = best_route(start, end, intermediary)
-            route_type = "avec point intermédiaire"
-        else:
-            path = route(start, end)
-            route_type = "directe"
+        with metrics.span('validation'):
+            if not (start in location_to_state and end in location_to_state):
+                raise ValueError("Points de départ/arrivée invalides")
+
+            if intermediary and intermediary not in location_to_state:
+                raise ValueError("Point intermédiaire invalide")
+
+            if any(stop not in location_to_state for stop in stops):
+                raise ValueError("Points de passage invalides")
+
+        via = ([intermediary] if intermediary else []) + stops
+
+        # Entraînement et parcours (détaillés par les étapes 'training' et 'walk')
+        with metrics.span('routing'):
+            if stops:
+                path = multi_stop_route(start, via, end)
+                route_type = "multi-arrêts"
+            elif intermediary:
+                path = best_route(start, end, intermediary)
+                route_type = "avec point intermédiaire"
+            else:
+                path = route(start, end)
+                route_type = "directe"
 
         path_str = " → ".join(path)
-        
-        # Logging
-        with open('routes_log.csv', 'a') as f:
-            f.write(f"{datetime.now()},{start},{end},{intermediary if intermediary else 'None'},{path_str}\n")
-        
-        return render_template('results.html', 
-                            path=path,
-                            path_str=path_str,
-                            start=start,
-                            end=end,
-                            intermediary=intermediary if intermediary else None,
-                            route_type=route_type)
+
+        # Logging (écriture groupée en arrière-plan)
+        with metrics.span('logging'):
+            route_log.get_writer(ROUTES_DB).log(start, end, path, via=','.join(via))
+
+        with metrics.span('render'):
+            return render_template('results.html',
+                                path=path,
+                                path_str=path_str,
+                                start=start,
+                                end=end,
+                                intermediary=intermediary if intermediary else None,
+                                stops=stops,
+                                route_type=route_type)
 
     except Exception as e:
         return render_template('error.html', error_message=str(e))
 
+@app.route('/api/routes', methods=['POST'])
+def api_routes():
+    """Calcul groupé : {"routes": [{"start": "A", "end": "G", "via": "F"}, ...], "mode": ..., "solver": ...}"""
+    started = time.perf_counter()
+    payload = request.get_json(silent=True)
+    if isinstance(payload, list):
+        payload = {'routes': payload}
+    if not isinstance(payload, dict) or not isinstance(payload.get('routes'), list):
+        return jsonify(error="Corps JSON attendu : {\"routes\": [{\"start\": ..., \"end\": ...}]}"), 400
+
+    mode = payload.get('mode', 'sample')
+    solver = payload.get('solver', 'qlearning')
+    if mode not in ('sample', 'sweep', 'sparse') or solver not in solvers:
+        return jsonify(error="Mode ou solveur inconnu"), 400
+
+    # Une route mal formée reçoit sa propre erreur, sans rejeter le reste du lot
+    requests_ = []
+    for item in payload['routes']:
+        if not isinstance(item, dict) or not item.get('start') or not item.get('end'):
+            requests_.append(None)
+            continue
+        requests_.append((str(item['start']).strip().upper(),
+                          str(item['end']).strip().upper(),
+                          str(item.get('via') or '').strip().upper() or None))
+
+    answers, goal_seconds = route_many([request_ for request_ in requests_ if request_ is not None],
+                                       mode=mode, solver=solver)
+    answers = iter(answers)
+    results = []
+    for request_ in requests_:
+        if request_ is None:
+            results.append({'start': None, 'end': None, 'via': None, 'path': None, 'steps': None,
+                            'error': "Chaque route doit avoir 'start' et 'end'", 'elapsed_ms': 0.0})
+            continue
+        answer = next(answers)
+        results.append({
+            'start': answer.start,
+            'end': answer.end,
+            'via': answer.via,
+            'path': answer.path,
+            'steps': None if answer.path is None else len(answer.path) - 1,
+            'error': answer.error,
+            'elapsed_ms': round(answer.seconds * 1000, 3),
+        })
+
+    return jsonify(
+        results=results,
+        unique_requests=len(set(requests_) - {None}),
+        policies={goal: round(seconds * 1000, 3) for goal, seconds in goal_seconds.items()},
+        elapsed_ms=round((time.perf_counter() - started) * 1000, 3),
+    )
+
 @app.route('/download')
 def download():
-    return send_file('routes_log.csv', as_attachment=True)
+    """Historique en CSV, filtrable par ?start=&end=&since=&until= (dates AAAA-MM-JJ[ HH:MM:SS])"""
+    writer = route_log.get_writer(ROUTES_DB)
+    writer.flush()
+    filters = {
+        'start_point': request.args.get('start', '').strip().upper() or None,
+        'end_point': request.args.get('end', '').strip().upper() or None,
+        'since': request.args.get('since') or None,
+        'until': request.args.get('until') or None,
+    }
+    return Response(stream_with_context(writer.history.iter_csv(**filters)), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=routes_log.csv'})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,177 @@
+"""Benchmarks for the routing engine.
+
+Times every trainer (per-sample, dense sweep, sparse sweep, batched
+all-goals, exact BFS), the route walk and a full /optimize request, on the
+A-L layout and on synthetic grid warehouses. Reports latency percentiles,
+peak traced memory and the optimality ratio (shortest hops / route hops,
+0 for a failed walk) of the learned routes.
+
+    python bench_routing.py --save bench_baseline.json
+    python bench_routing.py --compare bench_baseline.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import qlearning
+import shortest_paths
+from warehouse_graph import WarehouseGraph
+
+LAYOUTS = {
+    'A-L': lambda: qlearning.default_graph,
+    'grid-100': lambda: WarehouseGraph.grid(10, 10),
+    'grid-1k': lambda: WarehouseGraph.grid(32, 32),
+    'grid-10k': lambda: WarehouseGraph.grid(100, 100),
+}
+
+# Au-delà, les matrices denses N x N (et le tenseur N x N x N du mode groupé) ne sont plus raisonnables
+DENSE_LIMIT = 2000
+BATCH_LIMIT = 200
+
+
+def measure(function, repeats):
+    """Run function repeats times, then once more under tracemalloc.
+
+    Returns (result of the last run, latencies in s, peak traced bytes); the
+    traced run is kept out of the latencies since tracing slows allocations.
+    """
+    latencies, result = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = function()
+        latencies.append(time.perf_counter() - started)
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, latencies, peak
+
+
+def summarize(latencies, peak, optimality=None):
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1000, [50, 95, 99])
+    summary = {'p50_ms': round(p50, 4), 'p95_ms': round(p95, 4), 'p99_ms': round(p99, 4),
+               'peak_kb': round(peak / 1024, 1), 'runs': len(latencies)}
+    if optimality is not None:
+        summary['optimality'] = round(optimality, 4)
+    return summary
+
+
+def optimality_ratio(graph, goal, next_hop, starts):
+    dist = shortest_paths.bfs_distances(graph, graph.location_to_state[goal])
+    ratios = []
+    for start in starts:
+        path, clean = qlearning.walk(next_hop, start, goal, graph)
+        shortest = dist[graph.location_to_state[start]]
+        ratios.append((shortest / (len(path) - 1) if len(path) > 1 else 1.0) if clean else 0.0)
+    return float(np.mean(ratios))
+
+
+def bench_layout(name, graph, repeats, rng):
+    goals = [graph.locations[i] for i in rng.choice(graph.n_states, size=min(3, graph.n_states), replace=False)]
+    starts = [graph.locations[i] for i in rng.choice(graph.n_states, size=min(20, graph.n_states), replace=False)]
+    results = {}
+
+    modes = ['sparse'] if graph.n_states > DENSE_LIMIT else ['sample', 'sweep', 'sparse']
+    for mode in modes:
+        def train():
+            qlearning.invalidate_cache(goal, graph)
+            return qlearning.get_policy(goal, graph, mode=mode)
+        latencies, peak, ratios = [], 0, []
+        for goal in goals:
+            policy, goal_latencies, goal_peak = measure(train, repeats)
+            latencies += goal_latencies
+            peak = max(peak, goal_peak)
+            ratios.append(optimality_ratio(graph, goal, policy.next_hop, starts))
+        results[f'train:{mode}'] = summarize(latencies, peak, float(np.mean(ratios)))
+
+    if graph.n_states <= BATCH_LIMIT:
+        def train_batch():
+            qlearning.invalidate_cache(graph=graph)
+            return qlearning.train_all_goals(goals, graph)
+        next_hops, latencies, peak = measure(train_batch, repeats)
+        ratio = np.mean([optimality_ratio(graph, goal, next_hops[i], starts) for i, goal in enumerate(goals)])
+        results['train:all_goals'] = summarize(latencies, peak, float(ratio))
+
+    def exact():
+        return [shortest_paths.shortest_path_policy(graph, graph.location_to_state[goal]) for goal in goals]
+    _, latencies, peak = measure(exact, repeats)
+    results['solve:bfs'] = summarize(latencies, peak, 1.0)
+
+    next_hop = qlearning.next_hop_table(goals[0], graph, solver='bfs')
+    _, latencies, peak = measure(lambda: [qlearning.walk(next_hop, start, goals[0], graph) for start in starts],
+                                 repeats)
+    results['route:walk'] = summarize([latency / len(starts) for latency in latencies], peak)
+
+    if name == 'A-L':
+        results['request:optimize'] = bench_optimize(repeats)
+    return results
+
+
+def bench_optimize(repeats):
+    import app
+    client = app.app.test_client()
+    # Journal de mesure à part, pour ne pas polluer l'historique
+    app.ROUTES_DB = os.path.join(tempfile.mkdtemp(), 'bench_routes.db')
+
+    def post():
+        qlearning.invalidate_cache()
+        return client.post('/optimize', data={'start': 'A', 'end': 'L', 'intermediary': 'E'})
+    _, latencies, peak = measure(post, repeats)
+    return summarize(latencies, peak)
+
+
+def compare(results, baseline, threshold):
+    """Regressions against a baseline: slower p50 beyond threshold x, or lower optimality."""
+    regressions = []
+    for layout, cases in results['layouts'].items():
+        for case, current in cases.items():
+            previous = baseline.get('layouts', {}).get(layout, {}).get(case)
+            if previous is None:
+                continue
+            if current['p50_ms'] > previous['p50_ms'] * threshold:
+                regressions.append(f"{layout} {case}: p50 {previous['p50_ms']} -> {current['p50_ms']} ms")
+            if current.get('optimality', 1.0) < previous.get('optimality', 0.0) - 0.05:
+                regressions.append(f"{layout} {case}: optimality {previous['optimality']} -> {current['optimality']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks d'entraînement et de routage")
+    parser.add_argument('--layouts', nargs='+', choices=list(LAYOUTS), default=list(LAYOUTS))
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', help="écrire les résultats (référence JSON)")
+    parser.add_argument('--compare', help="comparer à une référence JSON")
+    parser.add_argument('--threshold', type=float, default=1.5, help="ralentissement p50 toléré (x)")
+    args = parser.parse_args(argv)
+
+    qlearning.use_policy_store(None)
+    rng = np.random.default_rng(args.seed)
+    qlearning.seed = args.seed
+    results = {'layouts': {}}
+    for name in args.layouts:
+        graph = LAYOUTS[name]()
+        results['layouts'][name] = bench_layout(name, graph, args.repeats, rng)
+        for case, summary in results['layouts'][name].items():
+            print(f"{name:9} {case:18} " + "  ".join(f"{key}={value}" for key, value in summary.items()))
+
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import heapq
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+import qlearning
+import shortest_paths
+
+# Une tâche de la flotte : la plus haute priorité est planifiée en premier
+Robot = namedtuple('Robot', ['name', 'start', 'goal', 'priority'], defaults=(0,))
+
+# Au-delà, les distances exactes sont calculées par destination plutôt que pour toutes les paires
+all_pairs_limit = 500
+
+
+class FleetPlanner:
+    """Plan a fleet of robots on one layout without collisions.
+
+    Robots move one aisle (or wait) per time step. They are planned one at a
+    time by decreasing priority with a space-time A* against a shared
+    reservation table, so no two robots hold the same location at the same
+    step or cross the same aisle in opposite directions. A robot that
+    reaches its goal stays there. Exact hop distances serve as the A*
+    heuristic, and the shortest path they give is taken as is whenever it
+    is free.
+    """
+
+    def __init__(self, graph=None):
+        self.graph = qlearning.default_graph if graph is None else graph
+        self.robots = {}
+        self.paths = {}
+        self.start_times = {}
+        self.failed = set()
+        self._tables = {}
+        self._nodes = {}                  # (état, t) -> robot
+        self._edges = {}                  # (u, v, t) -> robot allant de u (t) à v (t + 1)
+        self._visits = defaultdict(set)   # état -> instants réservés
+        self._parked = {}                 # état -> (t, robot) : le robot y reste à partir de t
+        self._held = defaultdict(lambda: (set(), set()))  # robot -> (ses nœuds, ses arcs)
+
+    def plan(self, robots, start_time=0):
+        """Plan robots (Robot tuples) leaving at start_time.
+
+        Returns {name: path} where path lists the robot's location at each
+        step from start_time, or None when no collision-free path to the goal
+        was found (the robot then waits on the nearest location where it is
+        in nobody's way; see self.paths).
+        """
+        robots = sorted(robots, key=lambda robot: -robot.priority)
+        starts = set()
+        for robot in robots:
+            if robot.name in self.robots:
+                raise ValueError(f"Robot {robot.name!r} is already planned")
+            for location in (robot.start, robot.goal):
+                if location not in self.graph.location_to_state:
+                    raise ValueError(f"Unknown location: {location}")
+            start_state = self.graph.location_to_state[robot.start]
+            parked = self._parked.get(start_state)
+            if start_state in starts or (start_state, start_time) in self._nodes or \
+                    (parked is not None and parked[0] <= start_time):
+                raise ValueError(f"Location {robot.start} is already held at step {start_time}")
+            starts.add(start_state)
+        for robot in robots:
+            self.robots[robot.name] = robot
+            self.start_times[robot.name] = start_time
+        # Les robots pas encore planifiés occupent déjà leur départ
+        for robot in robots:
+            self._reserve(robot.name, [self.graph.location_to_state[robot.start]], start_time, park=False)
+        for robot in robots:
+            self._plan_robot(robot.name, self.graph.location_to_state[robot.start], start_time)
+        return {robot.name: None if robot.name in self.failed else self.paths[robot.name] for robot in robots}
+
+    def delay(self, name, time, steps=1):
+        """Hold robot name in place for steps steps from time and repair the plan.
+
+        The delayed robot keeps its route, shifted by the delay; only the
+        robots whose reservations now collide with it are replanned, from
+        where they are at that time. Returns {name: new path} for every robot
+        whose path changed.
+        """
+        path, i = self.paths[name], time - self.start_times[name]
+        if i < 0 or i >= len(path) - 1:
+            return {}  # pas encore parti, ou déjà arrivé : il attend de toute façon
+        shifted = path[:i + 1] + [path[i]] * steps + path[i + 1:]
+        states = [self.graph.location_to_state[location] for location in shifted[i:]]
+        self._release(name, time)
+
+        blocked = set()
+        for j in range(len(states) - 1):
+            blocked |= self._conflicts(states[j], states[j + 1], time + j, name)
+        blocked |= self._conflicts_after(states[-1], time + len(states) - 1, name)
+        for other in blocked:
+            self._release(other, time)
+        self._reserve(name, states, time)
+        self.paths[name] = shifted
+
+        changed = {name: shifted}
+        changed.update(self._replan(blocked, time))
+        return changed
+
+    def _replan(self, robots, time):
+        """Replan robots (already released after time) from where they are at time, by priority."""
+        changed = {}
+        for other in sorted(robots, key=lambda robot: -self.robots[robot].priority):
+            other_path = self.paths[other]
+            j = min(max(time - self.start_times[other], 0), len(other_path) - 1)
+            changed[other] = self._plan_robot(other, self.graph.location_to_state[other_path[j]], time,
+                                              prefix=other_path[:j], changed=changed)
+        return changed
+
+    def positions(self, time):
+        """Location of every planned robot at a given step."""
+        return {name: path[min(max(time - self.start_times[name], 0), len(path) - 1)]
+                for name, path in self.paths.items()}
+
+    def _table(self, goal_state):
+        """(next_hop, hop distance) towards goal_state, shared with qlearning when the layout is small."""
+        if goal_state not in self._tables:
+            if self.graph.n_states <= all_pairs_limit and not np.any(self.graph.weights != 1):
+                next_hop, dist = qlearning.all_pairs_table(self.graph)
+                self._tables[goal_state] = next_hop[goal_state], dist[goal_state]
+            else:
+                self._tables[goal_state] = shortest_paths.shortest_path_policy(self.graph, goal_state)
+        return self._tables[goal_state]
+
+    def _plan_robot(self, name, start_state, start_time, prefix=(), changed=None):
+        robot = self.robots[name]
+        goal_state = self.graph.location_to_state[robot.goal]
+        self._release(name, start_time)
+        states = self._follow(name, start_state, goal_state, start_time) or \
+            self._search(name, start_state, goal_state, start_time)
+        blocked = set()
+        if states is None:
+            # Pas de chemin libre jusqu'au but : le robot s'écarte vers le point d'attente le plus proche
+            self.failed.add(name)
+            states = self._search(name, start_state, goal_state, start_time, park_anywhere=True)
+            if states is None:
+                # En dernier recours il reste sur place : ceux qui devaient y passer sont replanifiés
+                states = [start_state]
+                blocked = self._conflicts_after(start_state, start_time, name)
+                for other in blocked:
+                    self._release(other, start_time)
+        else:
+            self.failed.discard(name)
+        self._reserve(name, states, start_time)
+        self.paths[name] = list(prefix) + [self.graph.locations[state] for state in states]
+        if blocked:
+            replanned = self._replan(blocked, start_time)
+            if changed is not None:
+                changed.update(replanned)
+        return self.paths[name]
+
+    def _follow(self, name, start_state, goal_state, start_time):
+        """The precomputed shortest path, if it is free of conflicts."""
+        next_hop, dist = self._table(goal_state)
+        if not np.isfinite(dist[start_state]):
+            return None
+        states, t = [start_state], start_time
+        while states[-1] != goal_state:
+            nxt = int(next_hop[states[-1]])
+            if not self._free(states[-1], nxt, t, name):
+                return None
+            states.append(nxt)
+            t += 1
+        return states if self._can_park(goal_state, t, name) else None
+
+    def _search(self, name, start_state, goal_state, start_time, park_anywhere=False):
+        """Space-time A* from (start_state, start_time); waiting in place is a move.
+
+        With park_anywhere, the search ends on the first location, as close
+        to the goal as possible, where the robot can wait for good.
+        """
+        _, dist = self._table(goal_state)
+        if park_anywhere:
+            dist = np.where(np.isfinite(dist), dist, 0.0)
+        elif not np.isfinite(dist[start_state]):
+            return None
+        horizon = max([start_time] + [t for _, t in self._nodes]) + 2 * self.graph.n_states
+        came_from = {(start_state, start_time): None}
+        heap = [(start_time + dist[start_state], dist[start_state], start_time, start_state)]
+        while heap:
+            _, _, t, state = heapq.heappop(heap)
+            if (state == goal_state or park_anywhere) and self._can_park(state, t, name):
+                states, node = [], (state, t)
+                while node is not None:
+                    states.append(node[0])
+                    node = came_from[node]
+                return states[::-1]
+            if t >= horizon:
+                continue
+            for nxt in [state, *self.graph.neighbours(state).tolist()]:
+                if (nxt, t + 1) in came_from or not np.isfinite(dist[nxt]) or not self._free(state, nxt, t, name):
+                    continue
+                came_from[nxt, t + 1] = (state, t)
+                heapq.heappush(heap, (t + 1 + dist[nxt], dist[nxt], t + 1, nxt))
+        return None
+
+    def _free(self, state, nxt, t, name):
+        if self._nodes.get((nxt, t + 1), name) != name:
+            return False
+        parked = self._parked.get(nxt)
+        if parked is not None and parked[0] <= t + 1 and parked[1] != name:
+            return False
+        return nxt == state or self._edges.get((nxt, state, t), name) == name
+
+    def _conflicts(self, state, nxt, t, name):
+        """Robots that forbid moving from state (at t) to nxt (at t + 1)."""
+        robots = set()
+        holder = self._nodes.get((nxt, t + 1))
+        if holder is not None and holder != name:
+            robots.add(holder)
+        parked = self._parked.get(nxt)
+        if parked is not None and parked[0] <= t + 1 and parked[1] != name:
+            robots.add(parked[1])
+        crossing = self._edges.get((nxt, state, t))
+        if crossing is not None and crossing != name and nxt != state:
+            robots.add(crossing)
+        return robots
+
+    def _conflicts_after(self, state, t, name):
+        """Robots that will go through state after t, where name would park."""
+        return {self._nodes[state, later] for later in self._visits[state]
+                if later > t and self._nodes[state, later] != name}
+
+    def _can_park(self, state, t, name):
+        return not self._conflicts_after(state, t, name)
+
+    def _reserve(self, name, states, start_time, park=True):
+        """Reserve states[i] at start_time + i and the aisles between them; the robot parks on the last one."""
+        nodes, edges = self._held[name]
+        for i, state in enumerate(states):
+            self._nodes[state, start_time + i] = name
+            self._visits[state].add(start_time + i)
+            nodes.add((state, start_time + i))
+            if i + 1 < len(states):
+                self._edges[state, states[i + 1], start_time + i] = name
+                edges.add((state, states[i + 1], start_time + i))
+        if park:
+            for state, (_, holder) in list(self._parked.items()):
+                if holder == name:
+                    del self._parked[state]
+            self._parked[states[-1]] = (start_time + len(states) - 1, name)
+
+    def _release(self, name, time):
+        """Drop what name does after time: later locations, aisles taken from time on, its parking."""
+        nodes, edges = self._held[name]
+        for state, t in [node for node in nodes if node[1] > time]:
+            del self._nodes[state, t]
+            self._visits[state].discard(t)
+            nodes.discard((state, t))
+        for edge in [edge for edge in edges if edge[2] >= time]:
+            del self._edges[edge]
+            edges.discard(edge)
+        for state, (_, holder) in list(self._parked.items()):
+            if holder == name:
+                del self._parked[state]
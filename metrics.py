@@ -0,0 +1,106 @@
+"""In-process counters and timing histograms, exported in Prometheus text format."""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Bornes des histogrammes, en secondes (ou en nombre d'étapes pour les longueurs de route)
+BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+HOP_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+_help = {}
+_histogram_buckets = {}
+
+
+def describe(name, text, buckets=None):
+    """Register the HELP text (and optional buckets) of a metric."""
+    _help[name] = text
+    if buckets is not None:
+        _histogram_buckets[name] = tuple(buckets)
+
+
+def _labels_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def inc(name, value=1, **labels):
+    with _lock:
+        _counters[name, _labels_key(labels)] += value
+
+
+def observe(name, value, **labels):
+    buckets = _histogram_buckets.get(name, BUCKETS)
+    key = (name, _labels_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(buckets), 0.0, 0]
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                histogram[0][i] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+
+@contextmanager
+def span(stage, metric='stage_seconds', **labels):
+    """Time a block and record it in the metric histogram under stage=<stage>."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(metric, time.perf_counter() - started, stage=stage, **labels)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+
+def render():
+    """Every metric in the Prometheus text exposition format (version 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(value[0]), value[1], value[2]) for key, value in _histograms.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value:g}")
+
+    for name in sorted({name for name, _ in histograms}):
+        buckets = _histogram_buckets.get(name, BUCKETS)
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+            if metric != name:
+                continue
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', f'{bound:g}')])} {bucket_count}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+describe('stage_seconds', "Time spent per request stage")
+describe('request_seconds', "Request latency per endpoint")
+describe('policy_cache_total', "Policy lookups by result (hit, store_hit, coalesced, miss)")
+describe('training_iterations_total', "Q-learning iterations or sweeps run")
+describe('route_hops', "Length of extracted routes, in moves", HOP_BUCKETS)
@@ -0,0 +1,134 @@
+import time
+
+import numpy as np
+
+import qlearning
+import shortest_paths
+
+# Au-delà de ce nombre d'arrêts, la programmation dynamique exacte devient trop coûteuse
+exact_limit = 12
+
+
+def stop_distances(points, graph=None, mode='sample', solver='qlearning'):
+    """Matrix D[i, j] of travel cost from points[i] to points[j].
+
+    Exact solvers give shortest-path distances (weighted for 'dijkstra' and for
+    'all_pairs' on weighted layouts); 'qlearning' counts the hops of the routes
+    its cached policies produce, inf where no clean route exists.
+    """
+    graph = qlearning.default_graph if graph is None else graph
+    states = [graph.location_to_state[point] for point in points]
+    D = np.zeros((len(points), len(points)))
+    if solver == 'qlearning':
+        # Entraîner toutes les politiques manquantes en parallèle
+        for goal in points:
+            qlearning.get_policy_future(goal, graph, mode=mode)
+
+    for j, goal in enumerate(points):
+        if solver == 'all_pairs':
+            dist = qlearning.all_pairs_table(graph)[1][states[j]]
+        elif solver == 'bfs':
+            dist = shortest_paths.bfs_distances(graph, states[j])
+        elif solver == 'dijkstra':
+            dist = shortest_paths.dijkstra_distances(graph, states[j])
+        else:
+            next_hop = qlearning.next_hop_table(goal, graph, mode, solver)
+            for i, point in enumerate(points):
+                path, clean = qlearning.walk(next_hop, point, goal, graph)
+                D[i, j] = len(path) - 1 if clean else np.inf
+            continue
+        D[:, j] = dist[states]
+    return D
+
+
+def _tour_cost(D, tour):
+    return D[tour[:-1], tour[1:]].sum()
+
+
+def _held_karp(D):
+    """Exact order of stops 1..k between fixed start 0 and end k+1."""
+    k = len(D) - 2
+    stops = np.arange(1, k + 1)
+    D_stops = D[np.ix_(stops, stops)]
+    dp = np.full((1 << k, k), np.inf)
+    parent = np.full((1 << k, k), -1, dtype=np.int64)
+    dp[1 << np.arange(k), np.arange(k)] = D[0, stops]
+
+    for mask in range(1, 1 << k):
+        # Coût pour atteindre chaque arrêt j hors du masque en passant par le dernier arrêt i du masque
+        candidates = dp[mask][:, np.newaxis] + D_stops
+        best_prev = np.argmin(candidates, axis=0)
+        best_cost = candidates[best_prev, np.arange(k)]
+        for j in range(k):
+            if mask & (1 << j):
+                continue
+            new_mask = mask | (1 << j)
+            if best_cost[j] < dp[new_mask, j]:
+                dp[new_mask, j] = best_cost[j]
+                parent[new_mask, j] = best_prev[j]
+
+    full = (1 << k) - 1
+    last = int(np.argmin(dp[full] + D[stops, k + 1]))
+    order, mask = [], full
+    while last >= 0:
+        order.append(last + 1)
+        previous = parent[mask, last]
+        mask &= ~(1 << last)
+        last = int(previous)
+    return order[::-1]
+
+
+def _nearest_neighbour_two_opt(D, time_budget):
+    """Nearest-neighbour order of stops 1..k, improved by 2-opt until time_budget runs out."""
+    deadline = time.perf_counter() + time_budget
+    k = len(D) - 2
+    remaining = set(range(1, k + 1))
+    order, current = [], 0
+    while remaining:
+        current = min(remaining, key=lambda stop: (D[current, stop], stop))
+        order.append(current)
+        remaining.remove(current)
+
+    tour = np.array([0] + order + [k + 1])
+    best = _tour_cost(D, tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, k):
+            for j in range(i + 1, k + 1):
+                candidate = tour.copy()
+                candidate[i:j + 1] = candidate[i:j + 1][::-1]
+                cost = _tour_cost(D, candidate)
+                if cost < best:
+                    tour, best, improved = candidate, cost, True
+            if time.perf_counter() >= deadline:
+                break
+    return [int(stop) for stop in tour[1:-1]]
+
+
+def order_stops(D, time_budget=0.05):
+    """Visiting order of stops 1..k for a cost matrix whose first/last rows are start/end.
+
+    Uses an exact dynamic programme up to exact_limit stops, otherwise a
+    nearest-neighbour tour improved by 2-opt within time_budget seconds.
+    """
+    if len(D) <= 3:
+        return list(range(1, len(D) - 1))
+    if len(D) - 2 <= exact_limit:
+        return _held_karp(D)
+    return _nearest_neighbour_two_opt(D, time_budget)
+
+
+def multi_stop_route(starting_location, stops, ending_location, mode='sample', graph=None, solver='qlearning',
+                     time_budget=0.05, **route_options):
+    """Route from start to end through every stop of a pick list, in the cheapest order found."""
+    stops = list(dict.fromkeys(stop for stop in stops if stop not in (starting_location, ending_location)))
+    points = [starting_location] + stops + [ending_location]
+    D = stop_distances(points, graph, mode, solver)
+    order = order_stops(D, time_budget)
+
+    waypoints = [starting_location] + [points[i] for i in order] + [ending_location]
+    full_route = [starting_location]
+    for a, b in zip(waypoints, waypoints[1:]):
+        full_route += qlearning.route(a, b, mode, graph, solver, **route_options)[1:]
+    return full_route
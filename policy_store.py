@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+
+import numpy as np
+
+# Bump when the on-disk layout of an entry changes; older entries are then ignored
+FORMAT_VERSION = 1
+
+
+class PolicyStore:
+    """Directory of trained policies and tables, one sub-directory per cache key.
+
+    Each entry holds one .npy file per array plus a meta.json, and is written
+    to a temporary directory first then renamed into place, so readers never
+    see a half-written entry and concurrent writers of the same key are safe.
+    Arrays are loaded with mmap_mode='r': processes sharing a store share the
+    same pages in the OS page cache.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _entry(self, key):
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"v{FORMAT_VERSION}-{digest}")
+
+    def load(self, key):
+        """Return (arrays, meta) for key, or None when the entry is missing."""
+        entry = self._entry(key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as file:
+                meta = json.load(file)
+        except FileNotFoundError:
+            return None
+        arrays = {name: np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='r') for name in meta['arrays']}
+        return arrays, meta['meta']
+
+    def save(self, key, arrays, meta=None):
+        """Write arrays (name -> ndarray, None values skipped) and JSON-able meta under key."""
+        entry = self._entry(key)
+        if os.path.exists(entry):
+            return
+        tmp = os.path.join(self.directory, f".tmp-{os.getpid()}-{uuid.uuid4().hex}")
+        os.makedirs(tmp)
+        try:
+            names = []
+            for name, array in arrays.items():
+                if array is not None:
+                    np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(array))
+                    names.append(name)
+            with open(os.path.join(tmp, 'meta.json'), 'w') as file:
+                json.dump({'key': repr(key), 'arrays': names, 'meta': meta or {}}, file)
+            os.rename(tmp, entry)
+        except OSError:
+            # Un autre processus a écrit la même entrée entre-temps
+            if not os.path.exists(entry):
+                raise
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    def delete(self, key):
+        shutil.rmtree(self._entry(key), ignore_errors=True)
+
+    def clear(self):
+        """Delete every stored entry."""
+        for name in os.listdir(self.directory):
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
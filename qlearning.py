@@ -1,55 +1,794 @@
+"""Q-learning routing engine shared by the Flask API, the Streamlit app and the CLI.
+
+Only needs numpy (plus the local layout, store and metrics modules), so the
+API loads no plotting or UI library.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor
+
 import numpy as np
 
+import metrics
+import shortest_paths
+from policy_store import PolicyStore
+from warehouse_graph import WarehouseGraph
+
 # Parameters
 gamma = 0.75
 alpha = 0.9
+iterations = 1000
+
+# Graine des tirages du mode 'sample' (None : tirages non reproductibles)
+seed = 0
+
+# Warehouse layout
+default_graph = WarehouseGraph.load(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'warehouse_layout.json'))
+
+# States mapping and rewards of the default layout
+location_to_state = default_graph.location_to_state
+state_to_location = default_graph.state_to_location
+R = default_graph.reward_matrix()
+
+# A trained policy: its Q values (dense matrix, or per arc for mode="sparse"),
+# the greedy next state of every state, the training iterations it took and
+# its final Bellman (TD) residual
+Policy = namedtuple('Policy', ['Q', 'next_hop', 'iterations', 'residual'], defaults=(None, None))
+
+# Outcome of a route extraction, reported next to the path
+RouteStatus = namedtuple('RouteStatus', ['solver', 'iterations', 'residual', 'clean', 'hops', 'retrains', 'fallback'])
+
+# One answer of route_many(): the path (None on error), the error message and the extraction time
+RouteAnswer = namedtuple('RouteAnswer', ['start', 'end', 'via', 'path', 'error', 'seconds'])
+
+# Trained policies, keyed by (layout fingerprint, goal, gamma, alpha, iterations, mode, tol, seed)
+cache_size = 32
+_policy_cache = OrderedDict()
+_cache_lock = threading.RLock()
+
+# Entraînements en cours, partagés par toutes les requêtes qui visent la même politique
+_inflight = {}
+training_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('QLEARNING_TRAINING_THREADS', 2)),
+                                       thread_name_prefix='qlearning-training')
+# Threads dont les entraînements se font sur place (voir train_in_place)
+_local = threading.local()
+
+# Optional on-disk store shared by every process (set QLEARNING_POLICY_STORE or call use_policy_store)
+policy_store = PolicyStore(os.environ['QLEARNING_POLICY_STORE']) if os.environ.get('QLEARNING_POLICY_STORE') else None
+
+# Route solvers: the Q-learning policy, or an exact shortest-path backend
+solvers = ('qlearning', 'bfs', 'dijkstra', 'all_pairs')
+_all_pairs_tables = OrderedDict()
+
+
+class RouteError(ValueError):
+    """Raised when no clean route can be extracted; carries the partial path and its status."""
+
+    def __init__(self, message, path=None, status=None):
+        super().__init__(message)
+        self.path = path
+        self.status = status
+
+
+def use_policy_store(directory):
+    """Persist trained policies under directory (None to disable) and reuse them across processes."""
+    global policy_store
+    policy_store = None if directory is None else PolicyStore(directory)
+    return policy_store
+
+
+def use_training_executor(executor):
+    """Run background training on executor (e.g. a ProcessPoolExecutor to sidestep the GIL)."""
+    global training_executor
+    training_executor = executor
+    return training_executor
+
+
+def train_in_place(enabled=True):
+    """Train the calling thread's cache misses in the thread itself instead of on training_executor.
+
+    A profiler attached to the thread (app.py's slow-request profiler) then
+    sees the training; other callers waiting for the same policy still get
+    the same future.
+    """
+    _local.in_place = enabled
+
+
+def set_hyperparameters(gamma=None, alpha=None, iterations=None):
+    """Change the default gamma, alpha and iterations of every trainer; returns the new defaults."""
+    for name, value in (('gamma', gamma), ('alpha', alpha), ('iterations', iterations)):
+        if value is not None:
+            globals()[name] = value
+    return _hyperparameters(None, None, None)
+
+
+def load_hyperparameters(path, graph=None):
+    """Apply a configuration written by tune_hyperparameters.py for graph's layout.
+
+    A configuration tuned for mode='sweep' leaves iterations unchanged: the
+    sweeps stop on their own once converged.
+    """
+    graph = default_graph if graph is None else graph
+    with open(path) as file:
+        config = json.load(file)
+    if config.get('layout') not in (None, graph.fingerprint):
+        raise ValueError(f"{path} was tuned for another layout")
+    return set_hyperparameters(config.get('gamma'), config.get('alpha'), config.get('iterations'))
+
+
+def _hyperparameters(gamma, alpha, iterations):
+    return (
+        globals()['gamma'] if gamma is None else gamma,
+        globals()['alpha'] if alpha is None else alpha,
+        globals()['iterations'] if iterations is None else iterations,
+    )
+
+
+def train(ending_location, graph=None, gamma=None, alpha=None, iterations=None, mode='sample', tol=1e-6, seed=None):
+    """Train a fresh Q matrix for one destination.
+
+    mode='sample' runs one random TD update per iteration, drawn from seed (an
+    int, combined with the destination, or a numpy Generator used as is;
+    default: the module's seed), so a given seed always gives the same
+    matrix. mode='sweep' updates
+    every valid (state, action) pair at once per iteration and stops as soon as
+    the largest change drops below tol, relative to the goal's signal at the
+    farthest state (see stop_threshold). mode='sparse' runs the same sweep on
+    Q values stored per arc, aligned with graph.indices, and returns that
+    edge-indexed array instead of a states x states matrix.
+    """
+    return _train(ending_location, graph, gamma, alpha, iterations, mode, tol, seed)[0]
+
+
+def _train(ending_location, graph, gamma, alpha, iterations, mode, tol, seed=None):
+    """Train one destination, returning (Q, iterations used, final TD residual)."""
+    graph = default_graph if graph is None else graph
+    gamma, alpha, iterations = _hyperparameters(gamma, alpha, iterations)
+
+    ending_state = graph.location_to_state[ending_location]
+    if mode == 'sparse':
+        return _train_sparse(graph, ending_state, gamma, alpha, iterations,
+                             stop_threshold(graph, ending_state, gamma, tol))
+
+    R_goal = graph.reward_matrix()
+    R_goal[ending_state, ending_state] = 1000
+
+    if mode == 'sample':
+        return _train_sample(R_goal, gamma, alpha, iterations, _rng(seed, ending_state))
+    if mode == 'sweep':
+        return _train_sweep(R_goal, gamma, alpha, iterations, stop_threshold(graph, ending_state, gamma, tol))
+    raise ValueError(f"Unknown training mode: {mode!r}")
+
+
+def _rng(seed, ending_state):
+    if isinstance(seed, np.random.Generator):
+        return seed
+    seed = globals()['seed'] if seed is None else seed
+    # Un flux par destination : le résultat ne dépend pas de l'ordre des entraînements
+    return np.random.default_rng(None if seed is None else [seed, ending_state])
+
+
+def _sample_draws(R_goal, iterations, rng, block_size=4096):
+    """Yield the per-sample trainer's (states, next_states) moves, block by block."""
+    n_states = len(R_goal)
+    # Actions jouables de chaque état en CSR : ses allées, plus la boucle sur le but
+    sources, actions = np.nonzero(R_goal > 0)
+    action_ptr = np.zeros(n_states + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=n_states), out=action_ptr[1:])
+    degree = np.diff(action_ptr)
+
+    for block_start in range(0, iterations, block_size):
+        # Tirages par blocs : l'état courant, puis une action uniforme parmi les siennes
+        size = min(block_size, iterations - block_start)
+        states = rng.integers(0, n_states, size=size)
+        picks = rng.random(size)
+        states, picks = states[degree[states] > 0], picks[degree[states] > 0]
+        yield states, actions[action_ptr[states] + (picks * degree[states]).astype(np.int64)]
+
+
+def sample_moves(ending_location, graph=None, iterations=None, seed=None):
+    """The (states, next_states) moves mode='sample' trains on for this destination and seed, in order."""
+    graph = default_graph if graph is None else graph
+    iterations = _hyperparameters(None, None, iterations)[2]
+    ending_state = graph.location_to_state[ending_location]
+    R_goal = graph.reward_matrix()
+    R_goal[ending_state, ending_state] = 1000
+    blocks = list(_sample_draws(R_goal, iterations, _rng(seed, ending_state)))
+    if not blocks:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    return np.concatenate([states for states, _ in blocks]), np.concatenate([moves for _, moves in blocks])
+
+
+def _train_sample(R_goal, gamma, alpha, iterations, rng):
+    Q = np.zeros(R_goal.shape)
+    for states, next_states in _sample_draws(R_goal, iterations, rng):
+        rewards = R_goal[states, next_states]
+        for current_state, next_state, reward in zip(states.tolist(), next_states.tolist(), rewards.tolist()):
+            TD = reward + gamma * Q[next_state].max() - Q[current_state, next_state]
+            Q[current_state, next_state] += alpha * TD
+
+    mask = R_goal > 0
+    residual = np.abs(np.where(mask, R_goal + gamma * Q.max(axis=1)[np.newaxis, :] - Q, 0.0)).max()
+    return Q, iterations, float(residual)
+
+
+def stop_threshold(graph, ending_state, gamma, tol):
+    """Absolute change below which the sweep trainers stop, for a relative tol.
+
+    Every aisle pays 1 and the goal 1000, so a state d hops away is worth
+    999 * gamma**d / (1 - gamma) more than wandering: an absolute tol would
+    stop training before that signal reaches the far side of a large layout.
+    tol is therefore taken relative to the signal of the farthest state that
+    can reach the goal, but never below what float64 still resolves next to
+    the goal's own value (beyond that, nothing changes anymore).
+    """
+    dist = shortest_paths.bfs_distances(graph, ending_state)
+    signal = 999 * gamma ** dist[np.isfinite(dist)].max() / (1 - gamma)
+    return max(tol * signal, 8 * np.finfo(float).eps * 1000 / (1 - gamma))
+
+
+def _train_sweep(R_goal, gamma, alpha, max_sweeps, tol):
+    mask = R_goal > 0
+    rewards = np.where(mask, R_goal, 0).astype(float)
+    Q = np.zeros(R_goal.shape)
+    sweeps, residual = 0, np.inf
+    while sweeps < max_sweeps:
+        TD = rewards + gamma * Q.max(axis=1)[np.newaxis, :] - Q
+        TD[~mask] = 0.0
+        Q += alpha * TD
+        sweeps += 1
+        residual = np.abs(TD).max()
+        if alpha * residual < tol:
+            break
+    return Q, sweeps, float(residual)
+
+
+def _train_sparse(graph, ending_state, gamma, alpha, max_sweeps, tol):
+    q = np.zeros(graph.n_edges)
+    q_goal = 0.0  # Q value of staying on the goal, the only self-loop
+    sweeps, residual = 0, np.inf
+    while sweeps < max_sweeps:
+        V = graph.segment_max(q)
+        V[ending_state] = max(V[ending_state], q_goal)
+        TD = 1.0 + gamma * V[graph.indices] - q
+        TD_goal = 1000 + gamma * V[ending_state] - q_goal
+        q += alpha * TD
+        q_goal += alpha * TD_goal
+        sweeps += 1
+        residual = max(np.abs(TD).max(initial=0.0), abs(TD_goal))
+        if alpha * residual < tol:
+            break
+    return q, sweeps, float(residual)
+
+
+def _greedy_next_hop(Q, graph, ending_location, mode):
+    # Égalités : le plus petit état l'emporte (np.argmax et segment_argmax), jamais de tirage
+    if mode != 'sparse':
+        return np.argmax(Q, axis=1)
+    next_hop = graph.segment_argmax(Q)
+    ending_state = graph.location_to_state[ending_location]
+    next_hop[ending_state] = ending_state
+    return next_hop
+
+
+def _cache_key(ending_location, graph, gamma, alpha, iterations, mode, tol, seed=None):
+    graph = default_graph if graph is None else graph
+    return (
+        graph.fingerprint,
+        ending_location,
+        *_hyperparameters(gamma, alpha, iterations),
+        mode,
+        tol if mode in ('sweep', 'sparse') else None,
+        (globals()['seed'] if seed is None else seed) if mode == 'sample' else None,
+    )
+
+
+def get_policy(ending_location, graph=None, gamma=None, alpha=None, iterations=None, mode='sample', tol=1e-6,
+               seed=None, timeout=None):
+    """Return the trained Policy for a destination, training it only on a cache miss."""
+    return get_policy_future(ending_location, graph, gamma, alpha, iterations, mode, tol, seed).result(timeout)
+
+
+def get_policy_future(ending_location, graph=None, gamma=None, alpha=None, iterations=None, mode='sample', tol=1e-6,
+                      seed=None):
+    """Future of the trained Policy for a destination.
+
+    Cached policies come back as an already completed future. On a miss the
+    policy is trained on training_executor (or in place, see train_in_place),
+    and every caller asking for the
+    same policy before it is done gets the same future instead of starting
+    its own training.
+    """
+    graph = default_graph if graph is None else graph
+    gamma, alpha, iterations = _hyperparameters(gamma, alpha, iterations)
+    key = _cache_key(ending_location, graph, gamma, alpha, iterations, mode, tol, seed)
+    with _cache_lock:
+        policy = _policy_cache.get(key)
+        if policy is not None:
+            _policy_cache.move_to_end(key)
+            metrics.inc('policy_cache_total', result='hit')
+            return _completed(policy)
+        future = _inflight.get(key)
+        if future is not None:
+            metrics.inc('policy_cache_total', result='coalesced')
+            return future
+        future = _inflight[key] = Future()
+
+    try:
+        policy = _load_policy(key)
+    except BaseException as error:
+        _settle(key, future, error=error)
+        raise
+    if policy is not None:
+        metrics.inc('policy_cache_total', result='store_hit')
+        _settle(key, future, policy)
+        return future
+
+    metrics.inc('policy_cache_total', result='miss')
+    if getattr(_local, 'in_place', False):
+        training = Future()
+        try:
+            training.set_result(train_policy(ending_location, graph, gamma, alpha, iterations, mode, tol, key[-1]))
+        except BaseException as error:
+            training.set_exception(error)
+        _finish_training(key, future, training)
+        return future
+    try:
+        training = training_executor.submit(train_policy, ending_location, graph, gamma, alpha, iterations, mode, tol,
+                                            key[-1])
+    except BaseException as error:
+        _settle(key, future, error=error)
+        raise
+    training.add_done_callback(lambda training: _finish_training(key, future, training))
+    return future
+
+
+def _completed(policy):
+    future = Future()
+    future.set_result(policy)
+    return future
+
+
+def _finish_training(key, future, training):
+    try:
+        policy = _store_policy(key, *training.result())
+    except BaseException as error:
+        _settle(key, future, error=error)
+    else:
+        _settle(key, future, policy)
+
+
+def _settle(key, future, policy=None, error=None):
+    """Resolve an in-flight future; later callers will find the policy in the cache."""
+    with _cache_lock:
+        _inflight.pop(key, None)
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(policy)
+
+
+def train_policy(ending_location, graph=None, gamma=None, alpha=None, iterations=None, mode='sample', tol=1e-6,
+                 seed=None):
+    """Train a Policy for a destination without touching the cache."""
+    graph = default_graph if graph is None else graph
+    with metrics.span('training', mode=mode):
+        Q, iterations_used, residual = _train(ending_location, graph, gamma, alpha, iterations, mode, tol, seed)
+    metrics.inc('training_iterations_total', iterations_used, mode=mode)
+    return Policy(Q, _greedy_next_hop(Q, graph, ending_location, mode), iterations_used, residual)
+
+
+def store_policy(policy, ending_location, graph=None, gamma=None, alpha=None, iterations=None, mode='sample', tol=1e-6,
+                 seed=None):
+    """Add a Policy trained elsewhere (another process, a warm start...) to the cache and the store."""
+    key = _cache_key(ending_location, graph, gamma, alpha, iterations, mode, tol, seed)
+    return _store_policy(key, *policy)
+
+
+def _store_policy(key, Q, next_hop, iterations=None, residual=None, persist=True):
+    if Q is not None:
+        Q.setflags(write=False)
+    next_hop.setflags(write=False)
+    policy = Policy(Q, next_hop, iterations, residual)
+    with _cache_lock:
+        _policy_cache[key] = policy
+        _policy_cache.move_to_end(key)
+        while len(_policy_cache) > cache_size:
+            _policy_cache.popitem(last=False)
+    if persist and policy_store is not None:
+        policy_store.save(key, {'Q': Q, 'next_hop': next_hop}, {'iterations': iterations, 'residual': residual})
+    return policy
+
+
+def _load_policy(key):
+    """Fetch a policy from the on-disk store into the memory cache, or None."""
+    if policy_store is None:
+        return None
+    stored = policy_store.load(key)
+    if stored is None:
+        return None
+    arrays, meta = stored
+    return _store_policy(key, arrays.get('Q'), arrays['next_hop'], meta['iterations'], meta['residual'], persist=False)
+
+
+def invalidate_cache(ending_location=None, graph=None):
+    """Drop cached policies, optionally only for one destination and/or layout.
+
+    Dropped policies are also removed from the on-disk store, if one is in use.
+    """
+    fingerprint = None if graph is None else graph.fingerprint
+    with _cache_lock:
+        keys = [key for key in _policy_cache
+                if (ending_location is None or key[1] == ending_location)
+                and (fingerprint is None or key[0] == fingerprint)]
+        for key in keys:
+            del _policy_cache[key]
+    for key in keys:
+        if policy_store is not None:
+            policy_store.delete(key)
+
+
+def warm_cache(graph=None, gamma=None, alpha=None, iterations=None, mode='sample'):
+    """Pre-train the policy of every destination."""
+    graph = default_graph if graph is None else graph
+    for location in graph.locations:
+        get_policy(location, graph, gamma, alpha, iterations, mode)
+
+
+def update_layout(graph=None, add=(), remove=(), reweight=()):
+    """Change aisles at runtime and carry the cached policies over to the new layout.
+
+    update_layout(remove=[('H', 'L')]) closes the H-L aisle of the default
+    layout (which then becomes the new default). See migrate_policies for
+    what happens to the trained policies. Returns the new WarehouseGraph.
+    """
+    global default_graph, R
+    old_graph = default_graph if graph is None else graph
+    new_graph = old_graph.with_changes(add, remove, reweight)
+    migrate_policies(old_graph, new_graph)
+    if old_graph is default_graph:
+        default_graph = new_graph
+        R = new_graph.reward_matrix()
+    return new_graph
+
+
+def migrate_policies(old_graph, new_graph):
+    """Carry the cached Q-learning policies of old_graph over to new_graph.
+
+    Converged (sweep and sparse) policies are moved arc by arc and new arcs
+    start from their Bellman value. A goal whose state values are unchanged
+    around the modified aisles keeps its table as is; the others are
+    re-swept from their previous values, only over the arcs leading to
+    states whose value moved. These tables give the same next hops as a
+    cold retrain but not the same Q values, so they are cached in memory
+    only, never written to the policy store. Sample-mode policies stand for
+    a given (iterations, seed) run: they are retrained on the new layout in
+    the background instead. Exact solver tables are recomputed on demand.
+    The old layout's policies stay cached. Returns {'kept': n, 'updated': n,
+    'retrained': n} counts.
+    """
+    old_codes = old_graph.edge_sources * old_graph.n_states + old_graph.indices
+    new_codes = new_graph.edge_sources * new_graph.n_states + new_graph.indices
+    kept_arcs = np.isin(new_codes, old_codes)
+    old_arc = np.searchsorted(old_codes, new_codes[kept_arcs])
+    # Sources des arcs ajoutés ou supprimés : seules leurs valeurs peuvent changer directement
+    dirty = np.union1d(new_graph.edge_sources[~kept_arcs], old_graph.edge_sources[~np.isin(old_codes, new_codes)])
+
+    with _cache_lock:
+        entries = [(key, policy) for key, policy in _policy_cache.items()
+                   if len(key) == 8 and key[0] == old_graph.fingerprint]
+    counts = {'kept': 0, 'updated': 0, 'retrained': 0}
+    for key, policy in entries:
+        _, goal, gamma, alpha, iterations, mode, tol, seed = key
+        if mode == 'sample':
+            # Un démarrage à chaud ne reproduirait pas la course (iterations, seed) de la clé
+            get_policy_future(goal, new_graph, gamma, alpha, iterations, mode, seed=seed)
+            counts['retrained'] += 1
+            continue
+        goal_state = new_graph.location_to_state[goal]
+        if mode == 'sparse':
+            q_old, q_goal = np.array(policy.Q, dtype=float), 1000 / (1 - gamma)
+        else:
+            q_old = policy.Q[old_graph.edge_sources, old_graph.indices].astype(float)
+            q_goal = float(policy.Q[goal_state, goal_state])
+        V_old = old_graph.segment_max(q_old)
+        V_old[goal_state] = max(V_old[goal_state], q_goal)
+
+        q = np.empty(new_graph.n_edges)
+        q[kept_arcs] = q_old[old_arc]
+        q[~kept_arcs] = 1.0 + gamma * V_old[new_graph.indices[~kept_arcs]]
+        V = new_graph.segment_max(q)
+        V[goal_state] = max(V[goal_state], q_goal)
+
+        sweeps, residual = 0, policy.residual
+        if np.any(V[dirty] != V_old[dirty]):
+            with metrics.span('training', mode='update'):
+                threshold = stop_threshold(new_graph, goal_state, gamma, 1e-6 if tol is None else tol)
+                sweeps, q_goal, residual = _resweep(new_graph, goal_state, q, q_goal, V_old, dirty, gamma, iterations,
+                                                    threshold)
+            metrics.inc('training_iterations_total', sweeps, mode='update')
+            counts['updated'] += 1
+        else:
+            counts['kept'] += 1
+
+        if mode == 'sparse':
+            Q = q
+        else:
+            Q = np.zeros([new_graph.n_states, new_graph.n_states])
+            Q[new_graph.edge_sources, new_graph.indices] = q
+            Q[goal_state, goal_state] = q_goal
+        new_key = (new_graph.fingerprint,) + key[1:]
+        _store_policy(new_key, Q, _greedy_next_hop(Q, new_graph, goal, mode), (policy.iterations or 0) + sweeps,
+                      residual, persist=False)
+    return counts
+
+
+def _resweep(graph, ending_state, q, q_goal, V, dirty, gamma, max_sweeps, tol):
+    """Warm-started value iteration that only backs up the arcs whose target value moved.
+
+    V holds the state values before the change. Starts from the arcs leaving
+    the dirty states and updates q and V in place, with full Bellman backups
+    (alpha = 1): the fixed point is the same as the trainers', and settled
+    regions are not revisited. Returns (sweeps, q_goal, residual).
+    """
+    active = np.zeros(graph.n_states, dtype=bool)
+    active[dirty] = True
+    sweeps = 0
+    while active.any() and sweeps < max_sweeps:
+        arcs = active[graph.edge_sources]
+        q[arcs] = 1.0 + gamma * V[graph.indices[arcs]]
+        if active[ending_state]:
+            q_goal = 1000 + gamma * V[ending_state]
+        V_new = graph.segment_max(q)
+        V_new[ending_state] = max(V_new[ending_state], q_goal)
+        moved = np.abs(V_new - V) > tol
+        V[:] = V_new
+        sweeps += 1
+        # Les arcs qui mènent à un état dont la valeur a bougé sont à recalculer
+        active[:] = False
+        active[graph.edge_sources[moved[graph.indices]]] = True
+        active[ending_state] |= moved[ending_state]
+    residual = max(np.abs(1.0 + gamma * V[graph.indices] - q).max(initial=0.0),
+                   abs(1000 + gamma * V[ending_state] - q_goal))
+    return sweeps, q_goal, float(residual)
+
+
+def train_all_goals(goals=None, graph=None, gamma=None, alpha=None, iterations=None, tol=1e-6):
+    """Train the policies of several destinations in one batched sweep.
+
+    Works on a (goals x states x actions) Q tensor where each goal gets its own
+    reward diagonal. Every trained policy is added to the cache under
+    mode='sweep' (the cache grows to hold them all), so
+    route(start, end, mode='sweep') becomes a lookup; the default
+    mode='sample' does not read them. Returns the next-hop table:
+    next_hop[i, s] is the state to move to from s when heading for goals[i].
+    """
+    global cache_size
+    graph = default_graph if graph is None else graph
+    goals = list(graph.locations) if goals is None else list(goals)
+    gamma, alpha, iterations = _hyperparameters(gamma, alpha, iterations)
+
+    goal_states = np.array([graph.location_to_state[goal] for goal in goals])
+    R_goals = np.repeat(graph.reward_matrix().astype(float)[np.newaxis], len(goals), axis=0)
+    R_goals[np.arange(len(goals)), goal_states, goal_states] = 1000
+    mask = R_goals > 0
+    thresholds = np.array([stop_threshold(graph, state, gamma, tol) for state in goal_states])
+
+    Q = np.zeros(R_goals.shape)
+    sweeps, residuals = 0, np.full(len(goals), np.inf)
+    with metrics.span('training', mode='all_goals'):
+        while sweeps < iterations:
+            TD = R_goals + gamma * Q.max(axis=2)[:, np.newaxis, :] - Q
+            TD[~mask] = 0.0
+            Q += alpha * TD
+            sweeps += 1
+            residuals = np.abs(TD).max(axis=(1, 2))
+            if np.all(alpha * residuals < thresholds):
+                break
+    metrics.inc('training_iterations_total', sweeps, mode='all_goals')
+
+    next_hop = np.argmax(Q, axis=2)
+    cache_size = max(cache_size, len(goals))
+    for i, goal in enumerate(goals):
+        key = _cache_key(goal, graph, gamma, alpha, iterations, 'sweep', tol)
+        _store_policy(key, Q[i].copy(), next_hop[i].copy(), sweeps, float(residuals[i]))
+    return next_hop
+
+
+def all_pairs_table(graph=None):
+    """Exact all-pairs (next_hop, dist) tables indexed [goal, state], computed once per layout.
+
+    Uses repeated BFS, or repeated Dijkstra when the layout has weighted aisles.
+    """
+    graph = default_graph if graph is None else graph
+    tables = _all_pairs_tables.get(graph.fingerprint)
+    if tables is None:
+        key = ('all_pairs', graph.fingerprint)
+        stored = None if policy_store is None else policy_store.load(key)
+        if stored is not None:
+            tables = stored[0]['next_hop'], stored[0]['dist']
+        else:
+            weighted = bool(np.any(graph.weights != 1))
+            tables = shortest_paths.all_pairs(graph, weighted)
+            for table in tables:
+                table.setflags(write=False)
+            if policy_store is not None:
+                policy_store.save(key, {'next_hop': tables[0], 'dist': tables[1]})
+        _all_pairs_tables[graph.fingerprint] = tables
+        while len(_all_pairs_tables) > cache_size:
+            _all_pairs_tables.popitem(last=False)
+    return tables
+
+
+def _solver_policy(ending_location, graph, mode, solver, seed=None):
+    """Policy followed by the given solver; exact solvers have no Q values."""
+    if solver == 'qlearning':
+        return get_policy(ending_location, graph, mode=mode, seed=seed)
+    ending_state = graph.location_to_state[ending_location]
+    if solver == 'all_pairs':
+        return Policy(None, all_pairs_table(graph)[0][ending_state], 0, 0.0)
+    if solver in ('bfs', 'dijkstra'):
+        key = (graph.fingerprint, ending_location, solver)
+        with _cache_lock:
+            policy = _policy_cache.get(key)
+            if policy is not None:
+                _policy_cache.move_to_end(key)
+                return policy
+        policy = _load_policy(key)
+        if policy is None:
+            next_hop, _ = shortest_paths.shortest_path_policy(graph, ending_state, weighted=solver == 'dijkstra')
+            policy = _store_policy(key, None, next_hop, 0, 0.0)
+        return policy
+    raise ValueError(f"Unknown solver: {solver!r} (expected one of {', '.join(solvers)})")
+
+
+def next_hop_table(ending_location, graph=None, mode='sample', solver='qlearning'):
+    """Next state of every state when heading for ending_location with the given solver."""
+    graph = default_graph if graph is None else graph
+    return _solver_policy(ending_location, graph, mode, solver).next_hop
+
+
+def walk(next_hop, starting_location, ending_location, graph=None, max_hops=None):
+    """Follow a next-hop table from start to end.
+
+    Stops early on a revisited state, a dead end or after max_hops moves
+    (default: one less than the number of states, the longest simple path).
+    Returns (path, clean) where clean is True only if the end was reached.
+    """
+    graph = default_graph if graph is None else graph
+    max_hops = graph.n_states - 1 if max_hops is None else max_hops
 
-# States mapping
-location_to_state = {
-    'A': 0, 'B': 1, 'C': 2, 'D': 3, 'E': 4,
-    'F': 5, 'G': 6, 'H': 7, 'I': 8, 'J': 9,
-    'K': 10, 'L': 11
-}
-state_to_location = {v: k for k, v in location_to_state.items()}
-
-def route(starting_location, ending_location):
-    R = np.array([
-        [0,1,0,0,0,0,0,0,0,0,0,0],
-        [1,0,1,0,0,1,0,0,0,0,0,0],
-        [0,1,0,0,0,0,1,0,0,0,0,0],
-        [0,0,0,0,0,0,0,1,0,0,0,0],
-        [0,0,0,0,0,0,0,0,1,0,0,0],
-        [0,1,0,0,0,0,0,0,0,1,0,0],
-        [0,0,1,0,0,0,0,1,0,0,0,0],
-        [0,0,0,1,0,0,1,0,0,0,0,1],
-        [0,0,0,0,1,0,0,0,0,1,0,0],
-        [0,0,0,0,0,1,0,0,1,0,1,0],
-        [0,0,0,0,0,0,0,0,0,1,0,1],
-        [0,0,0,0,0,0,0,1,0,0,1,0]
-    ])
-    
-    ending_state = location_to_state[ending_location]
-    R[ending_state, ending_state] = 1000
-    
-    Q = np.zeros([12, 12])
-    for _ in range(1000):
-        current_state = np.random.randint(0, 12)
-        playable_actions = [j for j in range(12) if R[current_state, j] > 0]
-        next_state = np.random.choice(playable_actions)
-        TD = R[current_state, next_state] + gamma * Q[next_state, np.argmax(Q[next_state,])] - Q[current_state, next_state]
-        Q[current_state, next_state] += alpha * TD
-    
     route_path = [starting_location]
-    next_location = starting_location
-    while next_location != ending_location:
-        current_state = location_to_state[next_location]
-        next_state = np.argmax(Q[current_state,])
-        next_location = state_to_location[next_state]
-        route_path.append(next_location)
-    
-    return route_path
-
-def best_route(starting_location, ending_location, intermediary_location):
-    route1 = route(starting_location, intermediary_location)
-    route2 = route(intermediary_location, ending_location)[1:]
-    return route1 + route2
\ No newline at end of file
+    visited = {graph.location_to_state[starting_location]}
+    current_state = graph.location_to_state[starting_location]
+    ending_state = graph.location_to_state[ending_location]
+    while current_state != ending_state:
+        next_state = int(next_hop[current_state])
+        if next_state < 0 or next_state in visited or len(route_path) > max_hops:
+            return route_path, False
+        visited.add(next_state)
+        route_path.append(graph.state_to_location[next_state])
+        current_state = next_state
+    return route_path, True
+
+
+def route_with_status(starting_location, ending_location, mode='sample', graph=None, solver='qlearning',
+                      max_hops=None, retrains=0, fallback=None):
+    """Extract a route and report how it was obtained.
+
+    A walk that loops, dead-ends or exceeds max_hops is not clean. The policy
+    is then retrained up to `retrains` times (Q-learning only, drawing from
+    the following seeds) and, if still
+    not clean, the route is taken from the `fallback` solver when one is
+    given. Returns (path, RouteStatus); raises RouteError when every attempt
+    failed.
+    """
+    graph = default_graph if graph is None else graph
+    attempts = 0
+    while True:
+        # Chaque nouvel essai tire avec la graine suivante, ce qui reste reproductible
+        policy = _solver_policy(ending_location, graph, mode, solver, None if seed is None else seed + attempts)
+        with metrics.span('walk', solver=solver):
+            route_path, clean = walk(policy.next_hop, starting_location, ending_location, graph, max_hops)
+        status = RouteStatus(solver, policy.iterations, policy.residual, clean, len(route_path) - 1, attempts, None)
+        if clean or solver != 'qlearning' or attempts >= retrains:
+            break
+        attempts += 1
+        if seed is None:
+            invalidate_cache(ending_location, graph)
+
+    if not clean and fallback is not None:
+        fallback_path, fallback_status = route_with_status(starting_location, ending_location, graph=graph,
+                                                           solver=fallback, max_hops=max_hops)
+        return fallback_path, status._replace(hops=fallback_status.hops, fallback=fallback)
+    if not clean:
+        raise RouteError(f"No clean route from {starting_location} to {ending_location} "
+                         f"(solver={solver}, stopped after {status.hops} hops)", route_path, status)
+    metrics.observe('route_hops', status.hops)
+    return route_path, status
+
+
+def route(starting_location, ending_location, mode='sample', graph=None, solver='qlearning',
+          max_hops=None, retrains=0, fallback=None):
+    """The route from starting_location to ending_location (see route_with_status).
+
+    Each mode has its own cache entries: policies from train_all_goals are
+    stored under mode='sweep' and are only looked up with mode='sweep'.
+    """
+    return route_with_status(starting_location, ending_location, mode, graph, solver,
+                             max_hops, retrains, fallback)[0]
+
+def best_route(starting_location, ending_location, intermediary_location, mode='sample', graph=None, solver='qlearning',
+               max_hops=None, retrains=0, fallback=None):
+    layout = default_graph if graph is None else graph
+    if solver == 'qlearning' and {intermediary_location, ending_location} <= layout.location_to_state.keys():
+        # Les deux politiques s'entraînent en parallèle
+        for goal in (intermediary_location, ending_location):
+            get_policy_future(goal, layout, mode=mode)
+    route1 = route(starting_location, intermediary_location, mode, graph, solver, max_hops, retrains, fallback)
+    route2 = route(intermediary_location, ending_location, mode, graph, solver, max_hops, retrains, fallback)[1:]
+    return route1 + route2
+
+
+def route_many(requests, mode='sample', graph=None, solver='qlearning', max_hops=None):
+    """Answer many (start, end, via) requests at once; via may be None.
+
+    Identical requests are answered once and every destination's policy is
+    trained or looked up once, whatever the number of requests heading there.
+    Returns (answers in request order, {destination: seconds spent on its policy}).
+    """
+    graph = default_graph if graph is None else graph
+    requests = [(start, end, via or None) for start, end, via in requests]
+    unique = list(dict.fromkeys(requests))
+
+    goals = OrderedDict()
+    for start, end, via in unique:
+        if all(point is None or point in graph.location_to_state for point in (start, via, end)):
+            goals.update(dict.fromkeys(goal for goal in (via, end) if goal is not None))
+    if solver == 'qlearning':
+        # Lancer tous les entraînements manquants avant d'attendre le premier
+        for goal in goals:
+            get_policy_future(goal, graph, mode=mode)
+    next_hops, errors, goal_seconds = {}, {}, {}
+    for goal in goals:
+        started = time.perf_counter()
+        try:
+            next_hops[goal] = next_hop_table(goal, graph, mode, solver)
+        except ValueError as error:
+            errors[goal] = str(error)
+        goal_seconds[goal] = time.perf_counter() - started
+
+    answers = {}
+    for start, end, via in unique:
+        started = time.perf_counter()
+        path, error = None, None
+        unknown = [point for point in (start, via, end) if point is not None and point not in graph.location_to_state]
+        if unknown:
+            error = f"Unknown location: {', '.join(map(str, unknown))}"
+        else:
+            waypoints = [start, end] if via is None else [start, via, end]
+            path = [start]
+            for a, b in zip(waypoints, waypoints[1:]):
+                if b in errors:
+                    path, error = None, errors[b]
+                    break
+                leg, clean = walk(next_hops[b], a, b, graph, max_hops)
+                if not clean:
+                    path, error = None, f"No clean route from {a} to {b} (solver={solver})"
+                    break
+                path += leg[1:]
+        answers[start, end, via] = RouteAnswer(start, end, via, path, error, time.perf_counter() - started)
+
+    answers = [answers[request] for request in requests]
+    for answer in answers:
+        if answer.path is not None:
+            metrics.observe('route_hops', len(answer.path) - 1)
+    return answers, goal_seconds
+
+
+# Hyperparamètres réglés par tune_hyperparameters.py (QLEARNING_HYPERPARAMETERS=chemin du JSON)
+if os.environ.get('QLEARNING_HYPERPARAMETERS'):
+    load_hyperparameters(os.environ['QLEARNING_HYPERPARAMETERS'])
@@ -0,0 +1,135 @@
+"""Bulk routing: stream route requests from JSONL or CSV and write the answers.
+
+Requests are read lazily, answered window by window with route_many (so
+each destination's policy is trained once and identical requests are
+answered once) and written as they come, in input order.
+
+    python route_batch.py requests.jsonl -o routes.csv
+    cat requests.csv | python route_batch.py - --input-format csv > routes.jsonl
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from itertools import islice
+
+import qlearning
+from warehouse_graph import WarehouseGraph
+
+OUTPUT_FIELDS = ['id', 'start', 'end', 'via', 'path', 'steps', 'error']
+
+
+def _format(path, explicit):
+    if explicit:
+        return explicit
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+def read_requests(lines, fmt='jsonl'):
+    """Yield {'id', 'start', 'end', 'via', 'error'} dicts from JSONL or CSV lines.
+
+    Unreadable lines are yielded with an error instead of stopping the stream.
+    A request without an id gets its JSONL line number (or CSV data row number).
+    """
+    if fmt == 'csv':
+        rows = enumerate((({key.strip().lower(): value for key, value in row.items() if key}, None)
+                          for row in csv.DictReader(lines)), 1)
+    else:
+        # Numéroter avant d'écarter les lignes vides : l'id par défaut reste le numéro de ligne
+        rows = ((number, _parse_json(line)) for number, line in enumerate(lines, 1) if line.strip())
+    for number, (row, error) in rows:
+        if error is not None or not isinstance(row, dict) or not row.get('start') or not row.get('end'):
+            yield {'id': row.get('id', number) if isinstance(row, dict) else number, 'start': None, 'end': None, 'via': None,
+                   'error': error or "Missing 'start' or 'end'"}
+            continue
+        yield {
+            'id': row.get('id', number),
+            'start': str(row['start']).strip().upper(),
+            'end': str(row['end']).strip().upper(),
+            'via': str(row.get('via') or '').strip().upper() or None,
+            'error': None,
+        }
+
+
+def _parse_json(line):
+    """(value, None), or (None, error message) when the line is not JSON."""
+    try:
+        return json.loads(line), None
+    except ValueError as error:
+        return None, f"Invalid JSON: {error}"
+
+
+def answer_requests(requests, window=10000, mode='sample', graph=None, solver='qlearning', max_hops=None):
+    """Yield one result dict per request, answering window requests at a time."""
+    requests = iter(requests)
+    while True:
+        batch = list(islice(requests, window))
+        if not batch:
+            return
+        valid = [request for request in batch if request['error'] is None]
+        answers, _ = qlearning.route_many([(request['start'], request['end'], request['via']) for request in valid],
+                                          mode, graph, solver, max_hops)
+        answers = iter(answers)
+        for request in batch:
+            if request['error'] is not None:
+                yield dict(request, path=None, steps=None)
+                continue
+            answer = next(answers)
+            yield dict(request, path=answer.path, error=answer.error,
+                       steps=None if answer.path is None else len(answer.path) - 1)
+
+
+def write_results(results, file, fmt='jsonl'):
+    """Write results as they arrive; returns (written, failed) counts."""
+    written = failed = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(file, OUTPUT_FIELDS, lineterminator='\n')
+        writer.writeheader()
+    for result in results:
+        if fmt == 'csv':
+            writer.writerow(dict(result, path=' → '.join(result['path']) if result['path'] else ''))
+        else:
+            file.write(json.dumps({field: result[field] for field in OUTPUT_FIELDS}, ensure_ascii=False) + '\n')
+        written += 1
+        failed += result['error'] is not None
+    return written, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcul de routes en masse (JSONL ou CSV, fichier ou stdin)")
+    parser.add_argument('input', help="fichier de requêtes, ou - pour stdin")
+    parser.add_argument('-o', '--output', default='-', help="fichier de résultats (défaut : stdout)")
+    parser.add_argument('--input-format', choices=['jsonl', 'csv'])
+    parser.add_argument('--output-format', choices=['jsonl', 'csv'])
+    parser.add_argument('--window', type=int, default=10000, help="requêtes traitées ensemble")
+    parser.add_argument('--mode', choices=['sample', 'sweep', 'sparse'], default='sample')
+    parser.add_argument('--solver', choices=qlearning.solvers, default='qlearning')
+    parser.add_argument('--layout', help="plan JSON ou CSV (défaut : warehouse_layout.json)")
+    args = parser.parse_args(argv)
+
+    graph = WarehouseGraph.load(args.layout) if args.layout else None
+    # Toutes les politiques doivent rester en cache d'une fenêtre à l'autre
+    layout = qlearning.default_graph if graph is None else graph
+    qlearning.cache_size = max(qlearning.cache_size, layout.n_states)
+
+    started = time.perf_counter()
+    source = sys.stdin if args.input == '-' else open(args.input, newline='', encoding='utf-8')
+    target = sys.stdout if args.output == '-' else open(args.output, 'w', newline='', encoding='utf-8')
+    try:
+        requests = read_requests(source, _format(args.input, args.input_format))
+        results = answer_requests(requests, args.window, args.mode, graph, args.solver)
+        written, failed = write_results(results, target, _format(args.output, args.output_format))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+    elapsed = time.perf_counter() - started
+    print(f"{written} requêtes ({failed} en erreur) en {elapsed:.2f} s, "
+          f"{written / elapsed if elapsed else 0:.0f} requêtes/s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import argparse
+import csv
+import io
+import sqlite3
+from contextlib import closing
+from datetime import datetime, timedelta
+
+# Schéma unique de tous les journaux de routes (CSV et SQLite)
+FIELDS = ["Timestamp", "Start Point", "End Point", "Via", "Optimal Route", "Number of Steps", "Travel Time (s)"]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {prefix}routes (
+    id INTEGER PRIMARY KEY,
+    timestamp TEXT NOT NULL,
+    start_point TEXT NOT NULL,
+    end_point TEXT NOT NULL,
+    via TEXT,
+    route TEXT NOT NULL,
+    steps INTEGER,
+    travel_time REAL
+);
+CREATE INDEX IF NOT EXISTS {prefix}idx_routes_timestamp ON routes (timestamp);
+CREATE INDEX IF NOT EXISTS {prefix}idx_routes_start_end ON routes (start_point, end_point, timestamp);
+"""
+
+_COLUMNS = "timestamp, start_point, end_point, via, route, steps, travel_time"
+
+
+class RouteHistory:
+    """Route history in an SQLite table indexed on timestamp and (start, end).
+
+    Rows use the FIELDS order. Each call opens its own connection and the
+    database runs in WAL mode, so several threads and processes can append
+    while others read.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with closing(self._connect()) as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SCHEMA.format(prefix=''))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def append_many(self, rows):
+        rows = [[None if value == '' else value for value in row] for row in rows]
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(f"INSERT INTO routes ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def query(self, start_point=None, end_point=None, since=None, until=None, batch_size=1000):
+        """Yield matching rows oldest first, fetched batch_size at a time."""
+        clauses, params = [], []
+        for clause, value in (("start_point = ?", start_point), ("end_point = ?", end_point),
+                              ("timestamp >= ?", since), ("timestamp < ?", until)):
+            if value:
+                clauses.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        connection = self._connect()
+        try:
+            cursor = connection.execute(f"SELECT {_COLUMNS} FROM routes {where} ORDER BY timestamp, id", params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            connection.close()
+
+    def iter_csv(self, **filters):
+        """Yield the matching history as CSV text chunks, header first."""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(FIELDS)
+        for i, row in enumerate(self.query(**filters), 1):
+            writer.writerow(['' if value is None else value for value in row])
+            if i % 1000 == 0:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def rotate(self, max_age_days, archive_path=None):
+        """Move rows older than max_age_days to archive_path (or drop them); returns the row count."""
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%d %H:%M:%S")
+        connection = self._connect()
+        try:
+            with connection:
+                if archive_path:
+                    connection.execute("ATTACH DATABASE ? AS archive", (archive_path,))
+                    connection.executescript(_SCHEMA.format(prefix='archive.'))
+                    connection.execute(f"INSERT INTO archive.routes ({_COLUMNS}) "
+                                       f"SELECT {_COLUMNS} FROM routes WHERE timestamp < ?", (cutoff,))
+                moved = connection.execute("DELETE FROM routes WHERE timestamp < ?", (cutoff,)).rowcount
+            if archive_path:
+                connection.execute("DETACH DATABASE archive")
+        finally:
+            connection.close()
+        return moved
+
+    def compact(self):
+        """Reclaim the space left by rotated rows."""
+        connection = self._connect()
+        try:
+            connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+
+    def import_csv(self, csv_path):
+        """Append a CSV route log; returns (rows imported, unreadable rows skipped).
+
+        Reads logs written with the FIELDS schema (header optional) and the
+        original app's 5-column log: timestamp, start, end, intermediary
+        ('None' when there was none) and the route joined with ' → '.
+        """
+        rows, skipped = [], 0
+        with open(csv_path, newline='', encoding='utf-8') as file:
+            for number, row in enumerate(csv.reader(file)):
+                if number == 0 and row == FIELDS:
+                    continue
+                if len(row) == len(FIELDS):
+                    rows.append(row)
+                elif len(row) == 5 and row[4].strip():
+                    timestamp, start_point, end_point, via, route = (value.strip() for value in row)
+                    stops = [stop.strip() for stop in route.split('→')]
+                    # Horodatage de datetime.now() : les microsecondes sont retirées pour les filtres par date
+                    rows.append([timestamp[:19], start_point, end_point, '' if via == 'None' else via,
+                                 " -> ".join(stops), len(stops) - 1, ''])
+                else:
+                    skipped += 1
+        self.append_many(rows)
+        return len(rows), skipped
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Maintenance de l'historique des routes")
+    parser.add_argument('database')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    import_parser = subparsers.add_parser('import', help="importer un journal CSV")
+    import_parser.add_argument('csv_path')
+    rotate_parser = subparsers.add_parser('rotate', help="archiver les routes anciennes")
+    rotate_parser.add_argument('--days', type=float, default=90)
+    rotate_parser.add_argument('--archive')
+    subparsers.add_parser('compact', help="récupérer l'espace libéré")
+    args = parser.parse_args()
+
+    history = RouteHistory(args.database)
+    if args.command == 'import':
+        imported, skipped = history.import_csv(args.csv_path)
+        print(f"{imported} routes importées" + (f", {skipped} lignes illisibles ignorées" if skipped else ""))
+    elif args.command == 'rotate':
+        print(f"{history.rotate(args.days, args.archive)} routes archivées")
+    else:
+        history.compact()
@@ -0,0 +1,147 @@
+import atexit
+import csv
+import io
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from route_history import FIELDS, RouteHistory
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de verrou inter-processus, l'écriture reste en un seul append
+    fcntl = None
+
+# Marqueurs de contrôle placés dans la file à côté des lignes
+_FLUSH = object()
+_CLOSE = object()
+
+
+class RouteLogWriter:
+    """Append-only route log fed through an in-memory queue.
+
+    log() only enqueues the row; a background thread writes rows in batches of
+    batch_size or every flush_interval seconds, whichever comes first. A .db
+    or .sqlite filename goes to a RouteHistory table; anything else is a CSV
+    file where each batch is one append under an exclusive file lock, so
+    several processes can share a log without interleaving partial lines.
+    A batch that fails to write is counted in errors (last_error keeps the
+    exception) and retried with the next one.
+    """
+
+    def __init__(self, filename, batch_size=100, flush_interval=1.0, max_queue=100000):
+        self.filename = filename
+        self.history = RouteHistory(filename) if filename.endswith(('.db', '.sqlite')) else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = None
+        self._queue = queue.Queue(max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"route-log:{filename}", daemon=True)
+        self._thread.start()
+
+    def log(self, start_point, end_point, route, via=None, travel_time_seconds=None, timestamp=None):
+        """Queue one route for writing; never blocks on disk I/O."""
+        timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        row = [timestamp, start_point, end_point, via or '', " -> ".join(route), len(route) - 1,
+               '' if travel_time_seconds is None else travel_time_seconds]
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        """Block until every row queued so far is on disk, or failed to write (see errors)."""
+        self._queue.put(_FLUSH)
+        self._queue.join()
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._queue.put(_CLOSE)
+            self._thread.join()
+
+    def _run(self):
+        rows, fresh, deadline = [], 0, None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, list):
+                rows.append(item)
+                fresh += 1
+                deadline = deadline or time.monotonic() + self.flush_interval
+                if fresh < self.batch_size:
+                    continue
+            # Lot plein, délai écoulé, flush() ou close() : on écrit ce qui est en attente
+            if rows:
+                try:
+                    self._write(rows)
+                    rows, deadline = [], None
+                except Exception as error:
+                    # Le lot est gardé pour l'essai suivant ; flush() ne doit jamais rester bloqué
+                    self.errors += 1
+                    self.last_error = error
+                    if len(rows) > self._queue.maxsize > 0:
+                        self.dropped += len(rows) - self._queue.maxsize
+                        del rows[:len(rows) - self._queue.maxsize]
+                    deadline = time.monotonic() + self.flush_interval
+                for _ in range(fresh):
+                    self._queue.task_done()
+                fresh = 0
+            if item is not None and not isinstance(item, list):
+                self._queue.task_done()
+            if item is _CLOSE:
+                self.dropped += len(rows)
+                return
+
+    def _write(self, rows):
+        if self.history is not None:
+            self.history.append_many(rows)
+            return
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerows(rows)
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            data = buffer.getvalue()
+            if os.fstat(fd).st_size == 0:
+                header = io.StringIO()
+                csv.writer(header, lineterminator='\n').writerow(FIELDS)
+                data = header.getvalue() + data
+            os.write(fd, data.encode('utf-8'))
+        finally:
+            os.close(fd)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(filename):
+    """Shared writer for filename, created on first use and flushed at exit."""
+    path = os.path.abspath(filename)
+    with _writers_lock:
+        writer = _writers.get(path)
+        if writer is None:
+            writer = _writers[path] = RouteLogWriter(path)
+        return writer
+
+
+if hasattr(os, 'register_at_fork'):
+    # Le thread d'écriture ne survit pas à un fork : chaque processus enfant recrée ses writers
+    os.register_at_fork(after_in_child=_writers.clear)
+
+
+@atexit.register
+def close_all():
+    for writer in list(_writers.values()):
+        writer.close()
@@ -0,0 +1,70 @@
+import heapq
+from collections import deque
+
+import numpy as np
+
+
+def _predecessors(graph):
+    """Reverse CSR adjacency: for each state, the states with an arc into it."""
+    order = np.argsort(graph.indices, kind='stable')
+    indptr = np.zeros(graph.n_states + 1, dtype=np.int64)
+    np.cumsum(np.bincount(graph.indices, minlength=graph.n_states), out=indptr[1:])
+    return indptr, graph.edge_sources[order], graph.weights[order]
+
+
+def bfs_distances(graph, goal_state):
+    """Hop count from every state to goal_state (inf when unreachable)."""
+    indptr, sources, _ = _predecessors(graph)
+    dist = np.full(graph.n_states, np.inf)
+    dist[goal_state] = 0
+    queue = deque([goal_state])
+    while queue:
+        v = queue.popleft()
+        for u in sources[indptr[v]:indptr[v + 1]]:
+            if dist[u] == np.inf:
+                dist[u] = dist[v] + 1
+                queue.append(u)
+    return dist
+
+
+def dijkstra_distances(graph, goal_state):
+    """Weighted distance from every state to goal_state (inf when unreachable)."""
+    indptr, sources, weights = _predecessors(graph)
+    dist = np.full(graph.n_states, np.inf)
+    dist[goal_state] = 0.0
+    heap = [(0.0, goal_state)]
+    while heap:
+        d, v = heapq.heappop(heap)
+        if d > dist[v]:
+            continue
+        for k in range(indptr[v], indptr[v + 1]):
+            u = sources[k]
+            candidate = d + weights[k]
+            if candidate < dist[u]:
+                dist[u] = candidate
+                heapq.heappush(heap, (candidate, u))
+    return dist
+
+
+def next_hop_from_distances(graph, dist, goal_state, weighted=False):
+    """Greedy next state towards the goal given exact distances (-1 when unreachable)."""
+    step = graph.weights if weighted else np.ones(graph.n_edges)
+    next_hop = graph.segment_argmax(-(step + dist[graph.indices]))
+    next_hop[~np.isfinite(dist)] = -1
+    next_hop[goal_state] = goal_state
+    return next_hop
+
+
+def shortest_path_policy(graph, goal_state, weighted=False):
+    """Exact (next_hop, dist) towards one goal, by BFS or Dijkstra."""
+    dist = dijkstra_distances(graph, goal_state) if weighted else bfs_distances(graph, goal_state)
+    return next_hop_from_distances(graph, dist, goal_state, weighted), dist
+
+
+def all_pairs(graph, weighted=False):
+    """All-pairs (next_hop, dist) tables indexed [goal, state], by one search per goal."""
+    next_hop = np.empty((graph.n_states, graph.n_states), dtype=np.int64)
+    dist = np.empty((graph.n_states, graph.n_states))
+    for goal_state in range(graph.n_states):
+        next_hop[goal_state], dist[goal_state] = shortest_path_policy(graph, goal_state, weighted)
+    return next_hop, dist
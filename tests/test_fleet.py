@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from fleet import FleetPlanner, Robot
+from warehouse_graph import WarehouseGraph
+
+
+def assert_collision_free(planner):
+    horizon = max(planner.start_times[name] + len(path) for name, path in planner.paths.items())
+    for t in range(horizon + 1):
+        here, there = planner.positions(t), planner.positions(t + 1)
+        assert len(set(here.values())) == len(here), f"two robots share a location at step {t}"
+        for a in here:
+            for b in here:
+                assert a == b or not (here[a] == there[b] and here[b] == there[a] and here[a] != here[b]), \
+                    f"{a} and {b} swap places at step {t}"
+
+
+def test_failed_robot_does_not_block_higher_priorities():
+    planner = FleetPlanner()
+    paths = planner.plan([Robot('a', 'A', 'L', 1), Robot('b', 'B', 'L', 0)])
+    assert paths['a'] is not None and paths['a'][-1] == 'L'
+    assert paths['b'] is None
+    assert_collision_free(planner)
+
+
+def test_cornered_robot_replans_the_robots_it_blocks():
+    # Sur une ligne, le robot en échec ne peut s'écarter nulle part
+    graph = WarehouseGraph.grid(1, 4)
+    low, high = graph.locations[1], graph.locations[0]
+    planner = FleetPlanner(graph)
+    planner.plan([Robot('a', high, graph.locations[3], 1)])
+    planner.plan([Robot('b', low, high, 0)])
+    assert planner.failed == {'a', 'b'}
+    assert_collision_free(planner)
+
+
+def test_shared_start_is_rejected():
+    planner = FleetPlanner()
+    with pytest.raises(ValueError):
+        planner.plan([Robot('a', 'A', 'L'), Robot('b', 'A', 'G')])
+    assert not planner.robots
+
+
+def test_start_held_by_a_planned_robot_is_rejected():
+    planner = FleetPlanner()
+    planner.plan([Robot('a', 'A', 'L')])
+    with pytest.raises(ValueError):
+        planner.plan([Robot('b', 'L', 'A')], start_time=100)
+
+
+def test_random_fleet_is_collision_free():
+    graph = WarehouseGraph.grid(6, 6)
+    rng = np.random.default_rng(0)
+    starts = rng.choice(graph.n_states, 20, replace=False)
+    goals = rng.choice(graph.n_states, 20, replace=False)
+    planner = FleetPlanner(graph)
+    planner.plan([Robot(f'r{i}', graph.locations[s], graph.locations[g], int(rng.integers(3)))
+                  for i, (s, g) in enumerate(zip(starts, goals))])
+    planner.delay('r0', 1, 3)
+    assert_collision_free(planner)
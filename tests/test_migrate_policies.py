@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+import qlearning
+from warehouse_graph import WarehouseGraph
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    qlearning.invalidate_cache()
+    yield
+    qlearning.invalidate_cache()
+
+
+@pytest.mark.parametrize('mode', ['sweep', 'sparse'])
+@pytest.mark.parametrize('graph, changes', [
+    (qlearning.default_graph, {'remove': [('H', 'L')]}),
+    (WarehouseGraph.grid(6, 6), {'remove': [('2-2', '2-3'), ('3-2', '3-3')], 'add': [('0-0', '5-5', 1)]}),
+])
+def test_migrated_policies_route_like_a_cold_retrain(graph, changes, mode):
+    for goal in graph.locations:
+        qlearning.get_policy(goal, graph, mode=mode)
+    new_graph = graph.with_changes(**changes)
+    counts = qlearning.migrate_policies(graph, new_graph)
+    assert counts['updated'] > 0
+    for goal in new_graph.locations:
+        migrated = qlearning.get_policy(goal, new_graph, mode=mode)
+        cold = qlearning.train_policy(goal, new_graph, mode=mode)
+        assert np.array_equal(migrated.next_hop, cold.next_hop), goal
+
+
+def test_sample_policies_are_retrained_with_their_seed():
+    graph = qlearning.default_graph
+    qlearning.get_policy('L', graph, iterations=300, seed=7)
+    new_graph = graph.with_changes(remove=[('H', 'L')])
+    assert qlearning.migrate_policies(graph, new_graph)['retrained'] == 1
+    migrated = qlearning.get_policy('L', new_graph, iterations=300, seed=7)
+    cold = qlearning.train_policy('L', new_graph, iterations=300, seed=7)
+    assert np.array_equal(migrated.next_hop, cold.next_hop)
+    assert np.array_equal(migrated.Q, cold.Q)
@@ -0,0 +1,9 @@
+import qlearning
+from warehouse_graph import WarehouseGraph
+
+
+def test_sparse_training_reaches_the_far_side_of_a_large_layout():
+    graph = WarehouseGraph.grid(100, 100)
+    path, status = qlearning.route_with_status('0-0', '50-50', mode='sparse', graph=graph)
+    assert status.clean
+    assert len(path) - 1 == 100
@@ -0,0 +1,103 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import qlearning
+
+
+def _train_job(job):
+    """Worker: train one (layout, goal) and write Q / next_hop into the layout's shared blocks."""
+    graph, goal, row, params, q_block, hop_block = job
+    policy = qlearning.train_policy(goal, graph, **params)
+
+    q_shm = shared_memory.SharedMemory(name=q_block[0])
+    hop_shm = shared_memory.SharedMemory(name=hop_block[0])
+    try:
+        np.ndarray(q_block[1], dtype=float, buffer=q_shm.buf)[row] = policy.Q
+        np.ndarray(hop_block[1], dtype=np.int64, buffer=hop_shm.buf)[row] = policy.next_hop
+    finally:
+        q_shm.close()
+        hop_shm.close()
+    return policy.iterations, policy.residual
+
+
+class TrainingScheduler:
+    """Train many (layout, goal) policies across a pool of processes.
+
+    Each layout gets two shared-memory blocks, (goals x Q size) and
+    (goals x states); workers write their results in place and only send
+    back the iteration count and residual. Finished policies go into
+    qlearning's cache (and policy store), where route() finds them when it
+    is called with the same mode; the default, 'sample', is route()'s own.
+    """
+
+    def __init__(self, max_workers=None, mode='sample', gamma=None, alpha=None, iterations=None, tol=1e-6, seed=None):
+        self.max_workers = max_workers or os.cpu_count()
+        # La graine est figée ici : les workers tirent exactement comme le processus parent
+        seed = qlearning.seed if seed is None else seed
+        self.params = {'gamma': gamma, 'alpha': alpha, 'iterations': iterations, 'mode': mode, 'tol': tol,
+                       'seed': seed}
+        self._cancelled = threading.Event()
+
+    def cancel(self):
+        """Stop scheduling: pending jobs are dropped, running ones finish and are kept."""
+        self._cancelled.set()
+
+    def run(self, layouts, progress=None):
+        """Train every goal of every layout.
+
+        layouts is an iterable of WarehouseGraph, or of (graph, goals) pairs.
+        progress, if given, is called as progress(done, total, graph, goal)
+        after each job. Returns {(graph.fingerprint, goal): Policy} for the
+        jobs that completed.
+        """
+        self._cancelled.clear()
+        plans = []
+        for layout in layouts:
+            graph, goals = layout if isinstance(layout, tuple) else (layout, None)
+            plans.append((graph, list(graph.locations) if goals is None else list(goals)))
+        total = sum(len(goals) for _, goals in plans)
+        # Toutes les politiques doivent tenir dans le cache de route()
+        qlearning.cache_size = max(qlearning.cache_size, total)
+
+        blocks, results = [], {}
+        try:
+            jobs = []
+            for graph, goals in plans:
+                q_shape = (len(goals), graph.n_edges) if self.params['mode'] == 'sparse' else \
+                    (len(goals), graph.n_states, graph.n_states)
+                hop_shape = (len(goals), graph.n_states)
+                q_shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(q_shape)) * 8))
+                hop_shm = shared_memory.SharedMemory(create=True, size=max(1, int(np.prod(hop_shape)) * 8))
+                blocks.append((q_shm, hop_shm))
+                for row, goal in enumerate(goals):
+                    jobs.append((graph, goal, row, self.params, (q_shm.name, q_shape), (hop_shm.name, hop_shape),
+                                 q_shm, hop_shm))
+
+            with ProcessPoolExecutor(self.max_workers) as executor:
+                futures = {executor.submit(_train_job, job[:6]): job for job in jobs}
+                done = 0
+                for future in as_completed(futures):
+                    graph, goal, row, _, (_, q_shape), (_, hop_shape), q_shm, hop_shm = futures[future]
+                    if future.cancelled():
+                        continue
+                    iterations_used, residual = future.result()
+                    Q = np.ndarray(q_shape, dtype=float, buffer=q_shm.buf)[row].copy()
+                    next_hop = np.ndarray(hop_shape, dtype=np.int64, buffer=hop_shm.buf)[row].copy()
+                    policy = qlearning.Policy(Q, next_hop, iterations_used, residual)
+                    results[graph.fingerprint, goal] = qlearning.store_policy(policy, goal, graph, **self.params)
+                    done += 1
+                    if progress is not None:
+                        progress(done, total, graph, goal)
+                    if self._cancelled.is_set():
+                        for pending in futures:
+                            pending.cancel()
+        finally:
+            for q_shm, hop_shm in blocks:
+                for shm in (q_shm, hop_shm):
+                    shm.close()
+                    shm.unlink()
+        return results
@@ -0,0 +1,234 @@
+"""Hyperparameter sweep and auto-tuner for the Q-learning trainers.
+
+Trains every (gamma, alpha, iterations, seed) configuration of a grid, for
+a set of goals, in batched NumPy computations that make the same moves and
+updates as qlearning's trainers: a tuned configuration routes exactly as it
+was scored. Each configuration is scored by the share of (start, goal)
+pairs whose learned route is a shortest path, and by its cost: training
+iterations for mode='sample', sweeps to convergence for mode='sweep'. The
+cheapest configuration reaching --target is printed and, with --save,
+written as JSON for qlearning.load_hyperparameters.
+
+    python tune_hyperparameters.py --target 0.95 --save hyperparameters.json
+    QLEARNING_HYPERPARAMETERS=hyperparameters.json flask run
+"""
+import argparse
+import itertools
+import json
+import sys
+import time
+
+import numpy as np
+
+import qlearning
+import shortest_paths
+from warehouse_graph import WarehouseGraph
+
+# Taille maximale des tableaux d'un lot de configurations (tenseurs Q, récompenses, mouvements)
+batch_bytes = 256 * 2 ** 20
+
+
+def train_sample_batch(graph, configs):
+    """Per-sample training of many (gamma, alpha, iterations, seed, goal) configurations at once.
+
+    Returns their next-hop tables (configs x states), equal to those of
+    train_policy(goal, graph, gamma, alpha, iterations, 'sample', seed=seed).
+    """
+    draws = {}
+    for _, _, iterations, seed, goal in configs:
+        if (iterations, seed, goal) not in draws:
+            draws[iterations, seed, goal] = qlearning.sample_moves(goal, graph, iterations, seed)
+    moves = [draws[iterations, seed, goal] for _, _, iterations, seed, goal in configs]
+
+    length = max((len(states) for states, _ in moves), default=0)
+    S = np.zeros((len(configs), length), dtype=np.int64)
+    A = np.zeros((len(configs), length), dtype=np.int64)
+    valid = np.zeros((len(configs), length), dtype=bool)
+    for c, (states, next_states) in enumerate(moves):
+        S[c, :len(states)], A[c, :len(states)], valid[c, :len(states)] = states, next_states, True
+    # Seule la boucle sur le but relie un état à lui-même
+    rewards = np.where(S == A, 1000.0, 1.0)
+    gammas = np.array([config[0] for config in configs], dtype=float)
+    alphas = np.array([config[1] for config in configs], dtype=float)
+
+    Q = np.zeros((len(configs), graph.n_states, graph.n_states))
+    rows = np.arange(len(configs))
+    for t in range(length):
+        active = rows[valid[:, t]]
+        s, a = S[active, t], A[active, t]
+        TD = rewards[active, t] + gammas[active] * Q[active, a].max(axis=1) - Q[active, s, a]
+        Q[active, s, a] += alphas[active] * TD
+    return Q.argmax(axis=2)
+
+
+def train_sweep_batch(graph, configs, tol=1e-6):
+    """Sweep training of many (gamma, alpha, max_sweeps, goal) configurations at once.
+
+    Returns (next-hop tables, sweeps used), equal to those of
+    train_policy(goal, graph, gamma, alpha, max_sweeps, 'sweep', tol).
+    """
+    goal_states = np.array([graph.location_to_state[config[3]] for config in configs])
+    rewards = np.repeat(graph.reward_matrix().astype(float)[np.newaxis], len(configs), axis=0)
+    rewards[np.arange(len(configs)), goal_states, goal_states] = 1000
+    mask = rewards > 0
+    gammas = np.array([config[0] for config in configs], dtype=float)
+    alphas = np.array([config[1] for config in configs], dtype=float)
+    max_sweeps = np.array([config[2] for config in configs])
+    thresholds = {}
+    for gamma, goal_state in zip(gammas.tolist(), goal_states.tolist()):
+        if (gamma, goal_state) not in thresholds:
+            thresholds[gamma, goal_state] = qlearning.stop_threshold(graph, goal_state, gamma, tol)
+    thresholds = np.array([thresholds[key] for key in zip(gammas.tolist(), goal_states.tolist())])
+
+    Q = np.zeros(rewards.shape)
+    sweeps = np.zeros(len(configs), dtype=np.int64)
+    active = sweeps < max_sweeps
+    while active.any():
+        idx = np.flatnonzero(active)
+        TD = rewards[idx] + gammas[idx, None, None] * Q[idx].max(axis=2)[:, np.newaxis, :] - Q[idx]
+        TD[~mask[idx]] = 0.0
+        Q[idx] += alphas[idx, None, None] * TD
+        sweeps[idx] += 1
+        done = (alphas[idx] * np.abs(TD).max(axis=(1, 2)) < thresholds[idx]) | (sweeps[idx] >= max_sweeps[idx])
+        active[idx[done]] = False
+    return Q.argmax(axis=2), sweeps
+
+
+def optimal_routes(next_hop, goal_states, dist):
+    """Per configuration, (routes that are shortest paths, routes scored).
+
+    Walks from every start at once, for at most states - 1 moves like
+    qlearning.walk; dist[c] holds the hop distances to goal_states[c].
+    """
+    n_configs, n_states = next_hop.shape
+    rows = np.arange(n_configs)[:, np.newaxis]
+    position = np.tile(np.arange(n_states), (n_configs, 1))
+    hops = np.where(position == goal_states[:, np.newaxis], 0, -1)
+    for k in range(1, n_states):
+        position = next_hop[rows, position]
+        hops[(position == goal_states[:, np.newaxis]) & (hops < 0)] = k
+    starts = (np.arange(n_states) != goal_states[:, np.newaxis]) & np.isfinite(dist)
+    return ((hops == dist) & starts).sum(axis=1), starts.sum(axis=1)
+
+
+def sweep(graph, goals, gammas, alphas, iterations, seeds, mode='sample', tol=1e-6):
+    """Score every configuration of the grid.
+
+    Returns one dict per (gamma, alpha, iterations) with its success rate
+    (share of shortest routes over goals and seeds), its worst seed's success
+    rate and its cost: iterations for mode='sample', mean sweeps to
+    convergence for mode='sweep' (where iterations only caps them).
+    """
+    dist = {goal: shortest_paths.bfs_distances(graph, graph.location_to_state[goal]) for goal in goals}
+    configs = sorted(itertools.product(gammas, alphas, iterations, seeds if mode == 'sample' else [None], goals),
+                     key=lambda config: config[2])
+
+    totals = {}
+    for batch in _batches(graph, configs, mode):
+        if mode == 'sample':
+            next_hop = train_sample_batch(graph, batch)
+            cost = np.array([config[2] for config in batch])
+        else:
+            next_hop, cost = train_sweep_batch(graph, [(g, a, i, goal) for g, a, i, _, goal in batch], tol)
+        goal_states = np.array([graph.location_to_state[config[4]] for config in batch])
+        optimal, scored = optimal_routes(next_hop, goal_states, np.array([dist[config[4]] for config in batch]))
+        for config, *values in zip(batch, optimal, scored, cost):
+            entry = totals.setdefault(config[:3], {}).setdefault(config[3], [0, 0, 0.0, 0])
+            for i, value in enumerate(values + [1]):
+                entry[i] += value
+
+    results = []
+    for gamma, alpha, iteration_count in itertools.product(gammas, alphas, iterations):
+        by_seed = totals[gamma, alpha, iteration_count]
+        optimal, scored, cost, count = (sum(values[i] for values in by_seed.values()) for i in range(4))
+        results.append({
+            'gamma': gamma,
+            'alpha': alpha,
+            'iterations': iteration_count,
+            'success_rate': optimal / scored if scored else 1.0,
+            'worst_seed_success': min(values[0] / values[1] if values[1] else 1.0 for values in by_seed.values()),
+            'cost': cost / count,
+        })
+    return results
+
+
+def _batches(graph, configs, mode):
+    """Split configs (sorted by iterations) into batches that fit in batch_bytes.
+
+    A batch only holds configurations with the same number of iterations, so
+    short runs are not padded to the longest one.
+    """
+    for iteration_count, group in itertools.groupby(configs, key=lambda config: config[2]):
+        group = list(group)
+        if mode == 'sample':
+            # Q, plus par itération : tirages et S, A (int64), récompenses (float) et valid (bool)
+            config_bytes = graph.n_states ** 2 * 8 + iteration_count * (2 * 8 + 3 * 8 + 1)
+        else:
+            config_bytes = graph.n_states ** 2 * 8 * 3
+        per_batch = max(1, batch_bytes // config_bytes)
+        for offset in range(0, len(group), per_batch):
+            yield group[offset:offset + per_batch]
+
+
+def cheapest(results, target):
+    """The lowest-cost configuration whose success rate reaches target (None if there is none)."""
+    candidates = [result for result in results if result['success_rate'] >= target]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda result: (result['cost'], -result['success_rate'], -result['worst_seed_success']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Réglage automatique de gamma, alpha et du nombre d'itérations")
+    parser.add_argument('--layout', help="plan JSON ou CSV (défaut : warehouse_layout.json)")
+    parser.add_argument('--mode', choices=['sample', 'sweep'], default='sample')
+    parser.add_argument('--gammas', type=float, nargs='+', default=[0.6, 0.75, 0.9])
+    parser.add_argument('--alphas', type=float, nargs='+', default=[0.5, 0.7, 0.9, 1.0])
+    parser.add_argument('--iterations', type=int, nargs='+', default=[250, 500, 1000, 2000, 4000])
+    parser.add_argument('--seeds', type=int, default=5, help="graines 0..N-1 (mode sample)")
+    parser.add_argument('--goals', type=int, default=12, help="destinations tirées au hasard (toutes si moins)")
+    parser.add_argument('--target', type=float, default=0.95, help="part minimale de routes les plus courtes")
+    parser.add_argument('--tol', type=float, default=1e-6)
+    parser.add_argument('--save', help="écrire la configuration retenue (JSON)")
+    args = parser.parse_args(argv)
+
+    graph = WarehouseGraph.load(args.layout) if args.layout else qlearning.default_graph
+    goals = list(graph.locations)
+    if len(goals) > args.goals:
+        goals = [goals[i] for i in sorted(np.random.default_rng(0).choice(len(goals), args.goals, replace=False))]
+
+    started = time.perf_counter()
+    iterations = args.iterations if args.mode == 'sample' else [max(args.iterations)]
+    results = sweep(graph, goals, args.gammas, args.alphas, iterations, range(args.seeds), args.mode, args.tol)
+    elapsed = time.perf_counter() - started
+
+    for result in sorted(results, key=lambda result: (result['cost'], -result['success_rate'])):
+        print(f"gamma={result['gamma']:<5} alpha={result['alpha']:<4} iterations={result['iterations']:<5} "
+              f"succès={result['success_rate']:.3f} (pire graine {result['worst_seed_success']:.3f}) "
+              f"coût={result['cost']:.0f}")
+    print(f"{len(results)} configurations x {len(goals)} destinations en {elapsed:.2f} s")
+
+    best = cheapest(results, args.target)
+    if best is None:
+        print(f"Aucune configuration n'atteint {args.target:.0%} de routes les plus courtes")
+        return 1
+    config = {
+        'layout': graph.fingerprint,
+        'mode': args.mode,
+        'gamma': best['gamma'],
+        'alpha': best['alpha'],
+        # En mode sweep, l'entraînement s'arrête seul à la convergence
+        'iterations': best['iterations'] if args.mode == 'sample' else None,
+        'success_rate': best['success_rate'],
+        'worst_seed_success': best['worst_seed_success'],
+        'target': args.target,
+    }
+    print("Retenue : " + json.dumps(config))
+    if args.save:
+        with open(args.save, 'w') as file:
+            json.dump(config, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import csv
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+class WarehouseGraph:
+    """Warehouse layout: named locations joined by (optionally weighted) aisles.
+
+    Adjacency is kept in CSR form: the neighbours of state s are
+    indices[indptr[s]:indptr[s + 1]], sorted by state, with matching weights.
+    """
+
+    def __init__(self, locations, edges, directed=False):
+        self.locations = list(locations)
+        self.location_to_state = {location: state for state, location in enumerate(self.locations)}
+        self.state_to_location = {state: location for location, state in self.location_to_state.items()}
+        if len(self.location_to_state) != len(self.locations):
+            raise ValueError("Duplicate location names in layout")
+        self.directed = directed
+
+        sources, targets, weights = [], [], []
+        for edge in edges:
+            u, v = edge[0], edge[1]
+            weight = float(edge[2]) if len(edge) > 2 and edge[2] not in (None, '') else 1.0
+            if u not in self.location_to_state or v not in self.location_to_state:
+                raise ValueError(f"Edge {u}-{v} refers to an unknown location")
+            if u == v:
+                raise ValueError(f"Self-loop on {u} is not a valid aisle")
+            if weight <= 0:
+                raise ValueError(f"Edge {u}-{v} must have a positive weight")
+            sources.append(self.location_to_state[u])
+            targets.append(self.location_to_state[v])
+            weights.append(weight)
+            if not directed:
+                sources.append(self.location_to_state[v])
+                targets.append(self.location_to_state[u])
+                weights.append(weight)
+
+        sources = np.array(sources, dtype=np.int64)
+        targets = np.array(targets, dtype=np.int64)
+        weights = np.array(weights, dtype=float)
+        order = np.lexsort((targets, sources))
+        sources, targets, weights = sources[order], targets[order], weights[order]
+        # Un seul arc par paire (u, v) : la dernière déclaration l'emporte
+        keep = np.ones(len(sources), dtype=bool)
+        keep[:-1] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        sources, targets, weights = sources[keep], targets[keep], weights[keep]
+
+        self.indptr = np.zeros(self.n_states + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=self.n_states), out=self.indptr[1:])
+        self.indices = targets
+        self.weights = weights
+        self.edge_sources = sources
+        for array in (self.indptr, self.indices, self.weights, self.edge_sources):
+            array.setflags(write=False)
+
+        digest = hashlib.sha1(json.dumps(self.locations).encode())
+        for array in (self.indptr, self.indices, self.weights):
+            digest.update(array.tobytes())
+        self.fingerprint = digest.hexdigest()
+
+    @classmethod
+    def from_edges(cls, edges, locations=None, directed=False):
+        edges = [tuple(edge) for edge in edges]
+        if locations is None:
+            locations = sorted({location for edge in edges for location in edge[:2]})
+        return cls(locations, edges, directed)
+
+    @classmethod
+    def load(cls, path):
+        """Load a layout from a JSON file or a CSV edge list (source,target[,weight])."""
+        if os.path.splitext(path)[1].lower() == '.json':
+            with open(path) as file:
+                data = json.load(file)
+            return cls.from_edges(data['edges'], data.get('locations'), data.get('directed', False))
+
+        edges = []
+        with open(path, newline='') as file:
+            for row in csv.reader(file):
+                if not row or row[0].startswith('#'):
+                    continue
+                if not edges and row[0].strip().lower() in ('source', 'from', 'u'):
+                    continue
+                edges.append(tuple(cell.strip() for cell in row))
+        return cls.from_edges(edges)
+
+    @classmethod
+    def grid(cls, rows, cols):
+        """Synthetic rows x cols aisle grid, locations named 'r-c'."""
+        locations = [f"{r}-{c}" for r in range(rows) for c in range(cols)]
+        edges = [(f"{r}-{c}", f"{r}-{c + 1}") for r in range(rows) for c in range(cols - 1)]
+        edges += [(f"{r}-{c}", f"{r + 1}-{c}") for r in range(rows - 1) for c in range(cols)]
+        return cls(locations, edges)
+
+    def with_changes(self, add=(), remove=(), reweight=()):
+        """New layout with the same locations and aisles added, removed or reweighted.
+
+        add takes (u, v) or (u, v, weight) pairs, remove (u, v) pairs and
+        reweight (u, v, weight) triples; on an undirected layout (u, v) and
+        (v, u) name the same aisle.
+        """
+        edges = {(u, v): weight for u, v, weight in self.edge_list()}
+
+        def aisle(u, v):
+            if not self.directed and (u, v) not in edges and (v, u) in edges:
+                return v, u
+            return u, v
+
+        for edge in remove:
+            if edges.pop(aisle(*edge[:2]), None) is None:
+                raise ValueError(f"No aisle {edge[0]}-{edge[1]} to remove")
+        for u, v, weight in reweight:
+            if aisle(u, v) not in edges:
+                raise ValueError(f"No aisle {u}-{v} to reweight")
+            edges[aisle(u, v)] = weight
+        for edge in add:
+            edges[aisle(*edge[:2])] = edge[2] if len(edge) > 2 else 1.0
+        return WarehouseGraph(self.locations, [(u, v, weight) for (u, v), weight in edges.items()], self.directed)
+
+    @property
+    def n_states(self):
+        return len(self.locations)
+
+    @property
+    def n_edges(self):
+        return len(self.indices)
+
+    def neighbours(self, state):
+        return self.indices[self.indptr[state]:self.indptr[state + 1]]
+
+    def segment_max(self, values, empty=0.0):
+        """Per-state maximum of an edge-indexed array (empty for states without arcs)."""
+        result = np.full(self.n_states, empty, dtype=float)
+        starts = self.indptr[:-1][np.diff(self.indptr) > 0]
+        if len(starts):
+            result[np.diff(self.indptr) > 0] = np.maximum.reduceat(values, starts)
+        return result
+
+    def segment_argmax(self, values):
+        """Per-state neighbour with the largest edge value, lowest state on ties (-1 without arcs)."""
+        best = self.segment_max(values, empty=-np.inf)
+        candidates = np.flatnonzero(values == best[self.edge_sources])
+        # Les candidats sont triés par arc, donc le premier de chaque état a le plus petit voisin
+        states, first = np.unique(self.edge_sources[candidates], return_index=True)
+        result = np.full(self.n_states, -1, dtype=np.int64)
+        result[states] = self.indices[candidates[first]]
+        return result
+
+    def edge_list(self):
+        """(u, v, weight) location triples, each undirected aisle listed once."""
+        edges = []
+        for u in range(self.n_states):
+            for k in range(self.indptr[u], self.indptr[u + 1]):
+                v = self.indices[k]
+                if self.directed or u < v:
+                    edges.append((self.locations[u], self.locations[v], float(self.weights[k])))
+        return edges
+
+    def reward_matrix(self):
+        """Dense reward matrix R with 1 on every aisle, as used by the Q-learning trainers."""
+        R = np.zeros([self.n_states, self.n_states], dtype=np.int64)
+        R[np.repeat(np.arange(self.n_states), np.diff(self.indptr)), self.indices] = 1
+        return R
+
+    def __repr__(self):
+        return f"WarehouseGraph({self.n_states} locations, {self.n_edges} arcs)"
@@ -1,44 +1,23 @@
 import streamlit as st
 import numpy as np
-import csv
-from datetime import datetime
 import networkx as nx
-import matplotlib.pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from PIL import Image
 import io
-import time
-
-# Paramètres Q-learning
-gamma = 0.75
-alpha = 0.9
-
-# États
-location_to_state = {
-    'A': 0, 'B': 1, 'C': 2, 'D': 3, 'E': 4, 'F': 5,
-    'G': 6, 'H': 7, 'I': 8, 'J': 9, 'K': 10, 'L': 11
-}
-state_to_location = {state: location for location, state in location_to_state.items()}
-
-# Fonction CSV
-def save_route_to_csv(start_point, end_point, route, travel_time_seconds=None, filename="optimal_routes.csv"):
-    try:
-        with open(filename, 'r'):
-            pass
-    except FileNotFoundError:
-        with open(filename, 'w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow([
-                "Timestamp", "Start Point", "End Point",
-                "Optimal Route", "Number of Steps", "Travel Time (s)"
-            ])
-
-    with open(filename, 'a', newline='') as file:
-        writer = csv.writer(file)
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        route_str = " -> ".join(route)
-        writer.writerow([
-            timestamp, start_point, end_point,
-            route_str, len(route) - 1, travel_time_seconds
-        ])
+import threading
+import qlearning
+import route_log
+from pick_list import multi_stop_route
+
+# Plan de l'entrepôt et états : ceux du moteur partagé (qlearning.py)
+layout = qlearning.default_graph
+location_to_state = layout.location_to_state
+
+# Historique des routes (SQLite, écriture groupée en arrière-plan, voir route_log.py)
+def save_route(start_point, end_point, route, travel_time_seconds=None, filename="optimal_routes.db"):
+    route_log.get_writer(filename).log(start_point, end_point, route, travel_time_seconds=travel_time_seconds)
 
 def calculate_travel_time(route, time_per_step=5):
     steps = len(route) - 1
@@ -48,42 +27,11 @@ def calculate_travel_time(route, time_per_step=5):
     return minutes, seconds, total_seconds
 
 def route(starting_location, ending_location):
-    R = np.array([
-        [0,1,0,0,0,0,0,0,0,0,0,0],
-        [1,0,1,0,0,1,0,0,0,0,0,0],
-        [0,1,0,0,0,0,1,0,0,0,0,0],
-        [0,0,0,0,0,0,0,1,0,0,0,0],
-        [0,0,0,0,0,0,0,0,1,0,0,0],
-        [0,1,0,0,0,0,0,0,0,1,0,0],
-        [0,0,1,0,0,0,0,1,0,0,0,0],
-        [0,0,0,1,0,0,1,0,0,0,0,1],
-        [0,0,0,0,1,0,0,0,0,1,0,0],
-        [0,0,0,0,0,1,0,0,1,0,1,0],
-        [0,0,0,0,0,0,0,0,0,1,0,1],
-        [0,0,0,0,0,0,0,1,0,0,1,0]
-    ])
-
-    ending_state = location_to_state[ending_location]
-    R[ending_state, ending_state] = 1000
-    Q = np.zeros([12, 12])
-
-    for _ in range(1000):
-        current_state = np.random.randint(0, 12)
-        playable_actions = [j for j in range(12) if R[current_state, j] > 0]
-        next_state = np.random.choice(playable_actions)
-        TD = R[current_state, next_state] + gamma * Q[next_state, np.argmax(Q[next_state,])] - Q[current_state, next_state]
-        Q[current_state, next_state] += alpha * TD
-
-    route_path = [starting_location]
-    next_location = starting_location
-    while next_location != ending_location:
-        starting_state = location_to_state[next_location]
-        next_state = np.argmax(Q[starting_state,])
-        next_location = state_to_location[next_state]
-        route_path.append(next_location)
+    # Politique entraînée une seule fois par destination puis gardée en cache par le moteur
+    route_path = qlearning.route(starting_location, ending_location)
 
     travel_time = calculate_travel_time(route_path)
-    save_route_to_csv(starting_location, ending_location, route_path, travel_time_seconds=travel_time[2])
+    save_route(starting_location, ending_location, route_path, travel_time_seconds=travel_time[2])
     return route_path
 
 def best_route(starting_location, ending_location, intermediary_location):
@@ -91,75 +39,75 @@ def best_route(starting_location, ending_location, intermediary_location):
     route2 = route(intermediary_location, ending_location)[1:]
     full_route = route1 + route2
     travel_time = calculate_travel_time(full_route)
-    save_route_to_csv(starting_location, ending_location, full_route, travel_time_seconds=travel_time[2])
+    save_route(starting_location, ending_location, full_route, travel_time_seconds=travel_time[2])
     return full_route
 
+# ======== Visualisation : graphe, positions et fond de carte calculés une seule fois ==========
+class GraphView:
+    """Figure persistante du plan : le graphe gris est rendu une fois pour toutes,
+    seuls les arcs et nœuds de la route sont redessinés par-dessus."""
+
+    def __init__(self, graph):
+        self.lock = threading.Lock()
+        self.G = nx.Graph()
+        # Arcs d'abord : l'ordre des nœuds (et donc spring_layout) reste celui d'origine
+        self.G.add_weighted_edges_from(graph.edge_list())
+        self.G.add_nodes_from(graph.locations)
+        self.pos = nx.spring_layout(self.G, seed=42)
+
+        self.fig = Figure(figsize=(8, 6))
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.ax.set_axis_off()
+        nx.draw_networkx_edges(self.G, self.pos, ax=self.ax, edge_color='gray', width=2)
+        nx.draw_networkx_nodes(self.G, self.pos, ax=self.ax, node_color='lightgray', node_size=800)
+        self.labels = nx.draw_networkx_labels(self.G, self.pos, ax=self.ax, font_weight='bold')
+
+        # Calques de la route, exclus du fond (animated=True) et dessinés à la demande
+        self.route_edges = LineCollection([], colors='blue', linewidths=2, animated=True)
+        self.ax.add_collection(self.route_edges)
+        self.route_nodes = self.ax.scatter([], [], s=800, animated=True)
+
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def render(self, route, upto=None):
+        """Image RGBA du plan avec les upto premières étapes de la route en surbrillance."""
+        current = route if upto is None else route[:upto]
+        nodes = list(dict.fromkeys([route[0], route[-1]] + current))
+        colors = ['green' if node == route[0] else 'red' if node == route[-1] else 'orange' for node in nodes]
+        with self.lock:
+            canvas = self.fig.canvas
+            canvas.restore_region(self.background)
+            self.route_edges.set_segments([(self.pos[a], self.pos[b]) for a, b in zip(current, current[1:])])
+            self.route_nodes.set_offsets([self.pos[node] for node in nodes])
+            self.route_nodes.set_facecolor(colors)
+            self.ax.draw_artist(self.route_edges)
+            self.ax.draw_artist(self.route_nodes)
+            for node in nodes:
+                self.ax.draw_artist(self.labels[node])
+            return np.asarray(canvas.buffer_rgba()).copy()
+
+
+@st.cache_resource
+def graph_view(fingerprint):
+    return GraphView(layout)
+
 def draw_route_graph(route):
-    G = nx.Graph()
-    edges = [
-        ('A', 'B'), ('B', 'C'), ('B', 'F'), ('C', 'G'),
-        ('F', 'J'), ('G', 'H'), ('H', 'D'), ('H', 'L'),
-        ('J', 'I'), ('J', 'K'), ('K', 'L'), ('I', 'E'),
-    ]
-    G.add_edges_from(edges)
-    pos = nx.spring_layout(G, seed=42)
-
-    node_colors = ['green' if node == route[0] else
-                   'red' if node == route[-1] else
-                   'orange' if node in route else 'lightgray'
-                   for node in G.nodes()]
-
-    route_edges = set(zip(route, route[1:])) | set(zip(route[1:], route))
-    edge_colors = ['blue' if edge in route_edges else 'gray' for edge in G.edges()]
-
-    fig, ax = plt.subplots(figsize=(8, 6))
-    nx.draw(G, pos, with_labels=True, node_color=node_colors, edge_color=edge_colors,
-            node_size=800, width=2, font_weight='bold')
+    return graph_view(layout.fingerprint).render(route)
+
+@st.cache_data
+def route_animation(route, speed):
+    """GIF de la route, une image par étape (speed secondes chacune)."""
+    view = graph_view(layout.fingerprint)
+    frames = [Image.fromarray(view.render(list(route), i)).convert('RGB') for i in range(1, len(route) + 1)]
     buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plt.close(fig)
-    return buf
+    frames[0].save(buf, format="GIF", save_all=True, append_images=frames[1:], duration=int(speed * 1000), loop=0)
+    return buf.getvalue()
 
-# ======== NOUVEAU : Fonction d’animation ==========
+# ======== Animation : toutes les images rendues d'un coup dans un GIF ==========
 def animate_route(route, speed=0.8):
-    G = nx.Graph()
-    edges = [
-        ('A', 'B'), ('B', 'C'), ('B', 'F'), ('C', 'G'),
-        ('F', 'J'), ('G', 'H'), ('H', 'D'), ('H', 'L'),
-        ('J', 'I'), ('J', 'K'), ('K', 'L'), ('I', 'E'),
-    ]
-    G.add_edges_from(edges)
-    pos = nx.spring_layout(G, seed=42)
-
-    progress_bar = st.progress(0)
-    img_placeholder = st.empty()
-
-    for i in range(1, len(route)+1):
-        current_route = route[:i]
-
-        node_colors = ['green' if node == route[0] else
-                       'red' if node == route[-1] else
-                       'orange' if node in current_route else 'lightgray'
-                       for node in G.nodes()]
-
-        route_edges = set(zip(current_route, current_route[1:])) | set(zip(current_route[1:], current_route))
-        edge_colors = ['blue' if edge in route_edges else 'gray' for edge in G.edges()]
-
-        fig, ax = plt.subplots(figsize=(8, 6))
-        nx.draw(G, pos, with_labels=True, node_color=node_colors, edge_color=edge_colors,
-                node_size=800, width=2, font_weight='bold')
-        buf = io.BytesIO()
-        plt.savefig(buf, format="png")
-        buf.seek(0)
-        plt.close(fig)
-
-        img_placeholder.image(buf)
-        progress_bar.progress(i / len(route))
-
-        time.sleep(speed)
-
-    progress_bar.empty()
+    st.image(route_animation(tuple(route), speed))
 # ================================================
 
 # Interface Streamlit
@@ -168,7 +116,7 @@ st.set_page_config(page_title="Optimisation Entrepôt", layout="centered")
 st.title("Optimisation de Route d’Entrepôt avec Q-Learning")
 st.write("Trouvez les itinéraires optimaux dans votre entrepôt à l’aide de l’intelligence artificielle.")
 
-option = st.radio("Choisissez une option :", ["Route directe", "Route avec étape intermédiaire"])
+option = st.radio("Choisissez une option :", ["Route directe", "Route avec étape intermédiaire", "Route multi-arrêts"])
 
 locations = list(location_to_state.keys())
 
@@ -194,7 +142,7 @@ if option == "Route directe":
         if start != end:
             route_result = route(start, end)
             st.success(f" Route optimale : {' -> '.join(route_result)}")
-            st.info(f"Résultat enregistré dans `optimal_routes.csv`")
+            st.info(f"Résultat enregistré dans `optimal_routes.db`")
 
             minutes, seconds, total = calculate_travel_time(route_result, time_per_step)
             st.info(f"Temps estimé de parcours : {minutes} min {seconds} s ({total} secondes)")
@@ -224,7 +172,7 @@ elif option == "Route avec étape intermédiaire":
         if len({start, mid, end}) == 3:
             route_result = best_route(start, end, mid)
             st.success(f" Meilleure route via {mid} : {' -> '.join(route_result)}")
-            st.info(f"Résultat enregistré dans `optimal_routes.csv`")
+            st.info(f"Résultat enregistré dans `optimal_routes.db`")
 
             minutes, seconds, total = calculate_travel_time(route_result, time_per_step)
             st.info(f"Temps estimé de parcours : {minutes} min {seconds} s ({total} secondes)")
@@ -241,7 +189,42 @@ elif option == "Route avec étape intermédiaire":
         else:
             st.warning("Les trois points doivent être différents.")
 
+elif option == "Route multi-arrêts":
+    col1, col2 = st.columns(2)
+    with col1:
+        start = st.selectbox("Point de départ", locations, key="multi_start")
+    with col2:
+        end = st.selectbox("Point d’arrivée", locations, key="multi_end")
+    stops = st.multiselect("Points à visiter (liste de préparation)", locations, key="multi_stops")
+
+    if st.button("Trouver la meilleure tournée"):
+        if stops:
+            route_result = multi_stop_route(start, stops, end)
+            travel_time = calculate_travel_time(route_result)
+            save_route(start, end, route_result, travel_time_seconds=travel_time[2])
+            st.success(f" Meilleure tournée : {' -> '.join(route_result)}")
+            st.info(f"Résultat enregistré dans `optimal_routes.db`")
+
+            minutes, seconds, total = calculate_travel_time(route_result, time_per_step)
+            st.info(f"Temps estimé de parcours : {minutes} min {seconds} s ({total} secondes)")
+
+            total_distance = (len(route_result) - 1) * distance_per_step
+            time_by_speed = total_distance / robot_speed
+            mins_speed = int(time_by_speed) // 60
+            secs_speed = int(time_by_speed) % 60
+            st.info(f"Temps estimé à {robot_speed} m/s : {mins_speed} min {secs_speed} s pour {total_distance} m")
+
+            st.subheader(" Visualisation du graphe")
+            img_buf = draw_route_graph(route_result)
+            st.image(img_buf)
+        else:
+            st.warning("Choisissez au moins un point à visiter.")
+
 # ======== NOUVEAU : Bouton pour lancer l'animation ==========
+# La route est gardée dans la session : le clic sur « Lancer l’animation » relance le script
+if route_result:
+    st.session_state['route_result'] = route_result
+route_result = st.session_state.get('route_result', [])
 if route_result:
     st.markdown("---")
     st.subheader("Animation de la route")